@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+"""
+Ytelsesmåling av migrate_archive.py uten Drive-mounten.
+
+Lager et syntetisk arkiv formet som "900 Arkiv" i en midlertidig mappe og måler hvert trinn
+i migreringen for seg: gjennomgang av mappene, klassifisering, planlegging, duplikatsjekk med
+hashing og dry-run-utskrift. Med --latency-ms får hvert stat-, scandir- og open-kall en kunstig
+forsinkelse, omtrent som rundturene til Drive-mounten.
+
+Kjør med:
+    uv run documents/benchmark_migrate_archive.py --files 10000
+    uv run documents/benchmark_migrate_archive.py --files 50000 --latency-ms 1 --json før.json
+    uv run documents/benchmark_migrate_archive.py --files 50000 --latency-ms 1 --compare før.json
+
+Filene er små (i snitt rundt 8 kB), men 500 000 filer tar likevel et par GB; bruk --tree for å
+legge arkivet et sted med plass og gjenbruke det mellom kjøringene.
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import unicodedata
+from pathlib import Path
+
+import migrate_archive
+
+UNDERMAPPER = ["Gamle", "2019", "Styret 2014", "Diverse", "Vaktmesterhytta", "Ekstraordinær GF", "Fellesstyret 2020"]
+ENDELSER = [".pdf", ".pdf", ".docx", ".doc", ".xlsx", ".xls", ".txt", ".jpg"]
+
+# Filnavn slik de faktisk ser ut i arkivet; {dato} fylles med et av formatene i _dato
+MALER = [
+    "{dato} Styrereferat",
+    "Referat styremøte {dato}",
+    "Styrereferat {dato}",
+    "Protokoll GF {år}",
+    "Protokoll fra GF {dato}",
+    "Generalforsamling {år} innkalling",
+    "Innkalling til generalforsamling {år}",
+    "Medlemsmøte {dato}",
+    "Årsberetning {år}-{neste}",
+    "Årsberetning {år}",
+    "Regnskap {år}",
+    "Budsjett {neste}",
+    "Vårbrev {år}",
+    "Avtale vaktmester {år}",
+    "Kontrakt renovasjon",
+    "Instruks brannvern",
+    "Vedtekter",
+    "Vedtekter revidert {år}",
+    "Fellesstyret referat {dato}",
+    "Saksliste GF {år}",
+    "Valgkomiteens innstilling {år}",
+    "Statsbygg rapport {år}",
+    "Skjøtsel regler",
+    "Dugnadsliste {år}",
+    "Notat {dato}",
+    "Bilde {nr}",
+]
+
+# Andel av filene med hver egenskap
+ANDEL_NFD = 0.2  # Navn med dekomponerte æøå, som fra macOS
+ANDEL_DUPLIKAT = 0.1  # Samme navn som en tidligere fil i samme mappe, under en annen undermappe
+ANDEL_IDENTISK = 0.6  # Av duplikatene: likt innhold
+ANDEL_TEMP = 0.01  # ~$-filer fra Office
+ANDEL_DS_STORE = 0.005
+
+# Fil med parametrene arkivet ble laget med, så --tree kan gjenbrukes
+MERKE = ".benchmark.json"
+
+
+def _dato(r: random.Random, år: int) -> str:
+    mnd, dag = r.randint(1, 12), r.randint(1, 28)
+    return r.choice([
+        f"{år}-{mnd:02}-{dag:02}",
+        f"{år} {mnd:02} {dag:02}",
+        f"{dag:02}.{mnd:02}.{år}",
+        f"{dag}.{mnd}.{år % 100:02}",
+        f"{år}{mnd:02}{dag:02}",
+        f"{år}_{mnd:02}_{dag:02}",
+    ])
+
+
+def _filnavn(r: random.Random, nr: int) -> str:
+    år = r.randint(1998, 2025)
+    navn = r.choice(MALER).format(dato=_dato(r, år), år=år, neste=år + 1, nr=nr)
+    if r.random() < 0.1:
+        navn = navn.lower()
+    return navn + r.choice(ENDELSER)
+
+
+def _innhold(r: random.Random, nr: int) -> bytes:
+    # De fleste filene er små; noen få er store nok til at delvis hash og full hash skiller seg
+    terning = r.random()
+    if terning < 0.9:
+        størrelse = r.randint(100, 4096)
+    elif terning < 0.995:
+        størrelse = r.randint(4096, 64 * 1024)
+    else:
+        størrelse = r.randint(64 * 1024, 1024 * 1024)
+    hode = f"{nr}\n".encode()
+    return hode + r.randbytes(max(0, størrelse - len(hode)))
+
+
+def generer_arkiv(rot: Path, antall: int, frø: int = 0) -> Path:
+    """
+    Lager et syntetisk "900 Arkiv" under rot med omtrent antall filer, og returnerer kildemappen.
+    Samme frø gir samme arkiv.
+    """
+    r = random.Random(frø)
+    kilde = rot / "900 Arkiv"
+    kilde.mkdir(parents=True, exist_ok=True)
+    laget: dict[str, list[tuple[str, bytes]]] = {}
+
+    for nr in range(antall):
+        mappe = r.choice(migrate_archive.STANDARD_MAPPER)
+        under = r.sample(UNDERMAPPER, r.choice([0, 0, 1, 1, 2, 3]))
+        tidligere = laget.setdefault(mappe, [])
+
+        if tidligere and r.random() < ANDEL_DUPLIKAT:
+            navn, data = r.choice(tidligere)
+            if r.random() >= ANDEL_IDENTISK:
+                data = data[:-1] + bytes([data[-1] ^ 1])
+        else:
+            navn, data = _filnavn(r, nr), _innhold(r, nr)
+            if len(tidligere) < 1000:
+                tidligere.append((navn, data))
+
+        terning = r.random()
+        if terning < ANDEL_TEMP:
+            navn = "~$" + navn
+        elif terning < ANDEL_TEMP + ANDEL_DS_STORE:
+            navn = ".DS_Store"
+        if r.random() < ANDEL_NFD:
+            navn = unicodedata.normalize("NFD", navn)
+
+        mappesti = kilde.joinpath(mappe, *under)
+        mappesti.mkdir(parents=True, exist_ok=True)
+        sti = mappesti / navn
+        if not sti.is_dir():
+            sti.write_bytes(data)
+
+    (rot / MERKE).write_text(json.dumps({"files": antall, "seed": frø}))
+    return kilde
+
+
+@contextlib.contextmanager
+def forsinkelse(sekunder: float):
+    """Legger sekunder til hvert os.stat-, os.scandir- og open-kall, som en rundtur til Drive-mounten."""
+    if not sekunder:
+        yield
+        return
+
+    stat, scandir = os.stat, os.scandir
+
+    def treg_stat(*args, **kwargs):
+        time.sleep(sekunder)
+        return stat(*args, **kwargs)
+
+    def treg_scandir(*args, **kwargs):
+        time.sleep(sekunder)
+        return scandir(*args, **kwargs)
+
+    def treg_open(*args, **kwargs):
+        time.sleep(sekunder)
+        return builtins.open(*args, **kwargs)
+
+    os.stat, os.scandir = treg_stat, treg_scandir
+    migrate_archive.open = treg_open  # Bare filene migrate_archive selv åpner
+    try:
+        yield
+    finally:
+        os.stat, os.scandir = stat, scandir
+        del migrate_archive.open
+
+
+def _tøm_cacher() -> None:
+    """Nullstiller lru_cache-ene og mappetabellen, så hver måling starter kald."""
+    for verdi in vars(migrate_archive).values():
+        for kandidat in (verdi, *vars(verdi).values()) if isinstance(verdi, type) else (verdi,):
+            if hasattr(kandidat, "cache_clear"):
+                kandidat.cache_clear()
+    migrate_archive._MAPPER.clear()
+
+
+def _mål_trinn(mapper: list[str]) -> dict:
+    """Kjører hvert trinn én gang og returnerer {trinn: sekunder}."""
+    tider = {}
+
+    def tid(trinn: str, funksjon):
+        _tøm_cacher()
+        start = time.perf_counter()
+        resultat = funksjon()
+        tider[trinn] = time.perf_counter() - start
+        return resultat
+
+    kildemapper = [migrate_archive.KILDE / mappe for mappe in mapper]
+    filer = tid("skann", lambda: [fil for mappe in kildemapper for fil in migrate_archive.samle_filer(mappe)])
+    tid("klassifiser", lambda: [
+        migrate_archive.bestem_målmappe(fil, fil.relative_to(migrate_archive.KILDE)) for fil in filer
+    ])
+    flyttinger = tid("planlegg", lambda: migrate_archive.planlegg_flyttinger(mapper))
+    flyttinger = tid("duplikater", lambda: migrate_archive.avgjør_duplikater(flyttinger))
+    with contextlib.redirect_stdout(io.StringIO()):
+        tid("dry-run", lambda: migrate_archive.utfør_flyttinger(flyttinger, dry_run=True, avgjort=True))
+
+    tider["filer"] = len(flyttinger)
+    return tider
+
+
+def kjør(kilde: Path, gjentakelser: int, latens: float) -> dict:
+    """Måler alle trinnene gjentakelser ganger og returnerer {trinn: {min, median}} og antall filer."""
+    migrate_archive.DRIVE = migrate_archive.MÅL = kilde.parent
+    migrate_archive.KILDE = kilde
+    migrate_archive.HASHCACHE = None  # Mål hashingen, ikke cachen
+
+    runder = []
+    with forsinkelse(latens):
+        for _ in range(gjentakelser):
+            runder.append(_mål_trinn(migrate_archive.STANDARD_MAPPER))
+
+    resultat = {"filer": runder[0].pop("filer"), "trinn": {}}
+    for trinn in runder[0]:
+        målinger = [runde[trinn] for runde in runder]
+        resultat["trinn"][trinn] = {"min": min(målinger), "median": statistics.median(målinger)}
+    return resultat
+
+
+def _vis(resultat: dict, forrige: dict | None, terskel: float) -> list[str]:
+    """Skriver ut tabellen og returnerer trinnene som er tregere enn terskel mot forrige."""
+    print(f"\n{'='*60}")
+    print(f"{resultat['filer']} filer planlagt, {resultat['latens_ms']} ms latens, {resultat['gjentakelser']} runder")
+    print(f"{'='*60}\n")
+    print(f"  {'Trinn':<14}{'min':>10}{'median':>10}{'per fil':>12}{'endring':>10}")
+
+    tregere = []
+    for trinn, tider in resultat["trinn"].items():
+        per_fil = tider["min"] / max(resultat["filer"], 1) * 1e6
+        endring = ""
+        if forrige and trinn in forrige["trinn"]:
+            faktor = tider["min"] / forrige["trinn"][trinn]["min"] - 1
+            endring = f"{faktor:+.0%}"
+            if faktor > terskel:
+                tregere.append(trinn)
+                endring += " ⚠️"
+        print(f"  {trinn:<14}{tider['min']*1000:>8.0f}ms{tider['median']*1000:>8.0f}ms{per_fil:>10.1f}µs{endring:>10}")
+
+    print(f"\n{'='*60}\n")
+    return tregere
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Måler migrate_archive.py på et syntetisk arkiv")
+    parser.add_argument("--files", type=int, default=10000, help="Antall filer i det syntetiske arkivet")
+    parser.add_argument("--seed", type=int, default=0, help="Frø for generatoren; samme frø gir samme arkiv")
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0,
+        help="Kunstig forsinkelse per stat-, scandir- og open-kall, i millisekunder"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Antall runder per trinn; min og median vises")
+    parser.add_argument(
+        "--tree",
+        type=Path,
+        help="Mappe for arkivet; gjenbrukes hvis det ble laget med samme --files og --seed (ellers midlertidig)"
+    )
+    parser.add_argument("--json", type=Path, help="Lagre resultatet som JSON, f.eks. for --compare senere")
+    parser.add_argument("--compare", type=Path, help="Sammenlign med et resultat fra --json")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Andel et trinn kan være tregere enn i --compare før kjøringen feiler (standard 0.2)"
+    )
+    args = parser.parse_args()
+
+    rot = args.tree or Path(tempfile.mkdtemp(prefix="arkiv-"))
+    try:
+        merke = rot / MERKE
+        if merke.exists() and json.loads(merke.read_text()) == {"files": args.files, "seed": args.seed}:
+            print(f"Gjenbruker arkivet i {rot}")
+            kilde = rot / "900 Arkiv"
+        else:
+            if (rot / "900 Arkiv").exists():
+                print(f"❌ {rot} har et arkiv med andre parametre; velg en annen --tree")
+                return 1
+            print(f"Lager {args.files} filer i {rot}...")
+            start = time.perf_counter()
+            kilde = generer_arkiv(rot, args.files, args.seed)
+            print(f"  ferdig på {time.perf_counter() - start:.1f} s")
+
+        resultat = kjør(kilde, args.repeat, args.latency_ms / 1000)
+    finally:
+        if args.tree is None:
+            shutil.rmtree(rot)
+
+    resultat.update(latens_ms=args.latency_ms, gjentakelser=args.repeat, files=args.files, seed=args.seed)
+    forrige = json.loads(args.compare.read_text()) if args.compare else None
+    tregere = _vis(resultat, forrige, args.threshold)
+
+    if args.json:
+        args.json.write_text(json.dumps(resultat, indent=2, ensure_ascii=False))
+        print(f"✅ Lagret resultatet til {args.json}")
+
+    if tregere:
+        print(f"❌ Tregere enn {args.compare} med mer enn {args.threshold:.0%}: {', '.join(tregere)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,354 @@
+"""
+Local stand-in for the parts of the Drive v3 and Sheets v4 APIs used by the scripts in documents/.
+Tests point GOOGLE_DRIVE_API_ENDPOINT and GOOGLE_SHEETS_API_ENDPOINT at serve(), or mount
+FakeGoogle.handle in another server, e.g. an aiohttp app for read_sheet_async.
+
+Covers files list/get/create/update/generateIds, changes getStartPageToken/list, Drive batch requests,
+and spreadsheets get, values get and values batchGet. Errors can be queued per operation with fail().
+"""
+
+import contextlib
+import itertools
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+SPREADSHEET_MIME_TYPE = "application/vnd.google-apps.spreadsheet"
+
+ROUTES = [
+    ("GET", r"drive/v3/files", "files.list"),
+    ("POST", r"drive/v3/files", "files.create"),
+    ("GET", r"drive/v3/files/generateIds", "files.generateIds"),
+    ("GET", r"drive/v3/files/(?P<file_id>[^/]+)", "files.get"),
+    ("PATCH", r"drive/v3/files/(?P<file_id>[^/]+)", "files.update"),
+    ("GET", r"drive/v3/changes/startPageToken", "changes.getStartPageToken"),
+    ("GET", r"drive/v3/changes", "changes.list"),
+    ("GET", r"v4/spreadsheets/(?P<spreadsheet_id>[^/]+)", "spreadsheets.get"),
+    ("GET", r"v4/spreadsheets/(?P<spreadsheet_id>[^/]+)/values:batchGet", "values.batchGet"),
+    ("GET", r"v4/spreadsheets/(?P<spreadsheet_id>[^/]+)/values/(?P<a1>.+)", "values.get"),
+]
+
+_QUERY_TERMS = [
+    (re.compile(r"trashed = (true|false)"), lambda f, m: f["trashed"] == (m[1] == "true")),
+    (re.compile(r"name = '(.*)'"), lambda f, m: f["name"] == m[1].replace("\\'", "'")),
+    (re.compile(r"mimeType = '(.*)'"), lambda f, m: f["mimeType"] == m[1]),
+    (re.compile(r"'(.*)' in parents"), lambda f, m: m[1] in f["parents"]),
+]
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+    def body(self) -> dict:
+        return {"error": {"code": self.status, "message": self.reason, "errors": [{"reason": self.reason}]}}
+
+
+class FakeGoogle:
+    """
+    One shared drive with its files, change log and spreadsheets, kept in memory.
+    calls counts handled operations by name, e.g. calls["files.create"].
+    """
+
+    def __init__(self, drive_id: str = "shared-drive", max_page_size: int = 1000):
+        self.drive_id = drive_id
+        self.max_page_size = max_page_size
+        self.files: dict[str, dict] = {}
+        self.changes: list[dict] = []
+        self.spreadsheets: dict[str, dict] = {}
+        self.generated_ids: set[str] = set()
+        self.calls = Counter()
+        self.faults: dict[str, list[tuple[int, str, bool]]] = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.RLock()
+
+    # Test setup
+
+    def add_file(self, name: str, parent: str = None, mime_type: str = "application/pdf") -> str:
+        with self.lock:
+            file_id = f"file{next(self.ids)}"
+            self.files[file_id] = {
+                "id": file_id,
+                "name": name,
+                "mimeType": mime_type,
+                "parents": [parent or self.drive_id],
+                "trashed": False,
+                "version": 1,
+            }
+            self._changed(file_id)
+            return file_id
+
+    def add_folder(self, name: str, parent: str = None) -> str:
+        return self.add_file(name, parent, FOLDER_MIME_TYPE)
+
+    def add_spreadsheet(self, name: str, sheets: dict[str, list[list]], parent: str = None, row_count: int = 1000) -> str:
+        """Add a spreadsheet file; sheets maps tab title to its rows, row_count is the grid size of every tab."""
+        with self.lock:
+            spreadsheet_id = self.add_file(name, parent, SPREADSHEET_MIME_TYPE)
+            self.spreadsheets[spreadsheet_id] = {
+                "title": name,
+                "sheets": {title: {"rows": rows, "row_count": max(row_count, len(rows))} for title, rows in sheets.items()},
+            }
+            return spreadsheet_id
+
+    def update_file(self, file_id: str, **fields):
+        with self.lock:
+            self.files[file_id].update(fields)
+            self.files[file_id]["version"] += 1
+            self._changed(file_id)
+
+    def trash(self, file_id: str):
+        self.update_file(file_id, trashed=True)
+
+    def remove(self, file_id: str):
+        """Delete permanently, which shows up in changes().list as removed."""
+        with self.lock:
+            del self.files[file_id]
+            self.changes.append({"changeType": "file", "fileId": file_id, "removed": True})
+
+    def fail(self, operation: str, status: int = 429, reason: str = "rateLimitExceeded", times: int = 1, after: bool = False):
+        """
+        Answer the next `times` calls to operation with an error.
+        With after=True the call is carried out first, like a response lost on the way back.
+        """
+        with self.lock:
+            self.faults.setdefault(operation, []).extend([(status, reason, after)] * times)
+
+    def children(self, parent: str) -> list[str]:
+        """Names of the files in a folder, trashed ones excluded, sorted."""
+        return sorted(f["name"] for f in self.files.values() if parent in f["parents"] and not f["trashed"])
+
+    def _changed(self, file_id: str):
+        self.changes.append({"changeType": "file", "fileId": file_id, "removed": False, "file": self._public(file_id)})
+
+    def _public(self, file_id: str) -> dict:
+        f = self.files[file_id]
+        return {key: f[key] for key in ("id", "name", "mimeType", "parents", "trashed")}
+
+    # Requests
+
+    def handle(self, method: str, url: str, body: dict = None) -> tuple[int, dict]:
+        """Answer one API call; url is the path with query string. Returns (status, JSON body)."""
+        parts = urlsplit(url)
+        path = parts.path.strip("/")
+        params = parse_qs(parts.query)
+        for route_method, pattern, operation in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, ApiError(404, f"No route for {method} {path}").body()
+
+        with self.lock:
+            self.calls[operation] += 1
+            queued = self.faults.get(operation)
+            status, reason, after = queued.pop(0) if queued else (None, None, False)
+            try:
+                if status is not None and not after:
+                    raise ApiError(status, reason)
+                result = getattr(self, "_" + operation.replace(".", "_"))(params, body or {}, **match.groupdict())
+                if status is not None:
+                    raise ApiError(status, reason)
+            except ApiError as e:
+                return e.status, e.body()
+            return 200, result
+
+    @staticmethod
+    def _param(params: dict, name: str, default: str = None) -> str:
+        return params.get(name, [default])[0]
+
+    def _page(self, params: dict, items: list) -> tuple[list, str | None]:
+        start = int(self._param(params, "pageToken") or 0)
+        size = min(int(self._param(params, "pageSize", "100")), self.max_page_size)
+        end = start + size
+        return items[start:end], str(end) if end < len(items) else None
+
+    def _files_list(self, params, body):
+        files = list(self.files.values())
+        for term in filter(None, self._param(params, "q", "").split(" and ")):
+            for pattern, test in _QUERY_TERMS:
+                m = pattern.fullmatch(term.strip())
+                if m:
+                    files = [f for f in files if test(f, m)]
+                    break
+            else:
+                raise ApiError(400, f"Unsupported query term: {term}")
+        page, next_token = self._page(params, files)
+        result = {"files": [self._public(f["id"]) for f in page]}
+        if next_token:
+            result["nextPageToken"] = next_token
+        return result
+
+    def _files_get(self, params, body, file_id):
+        if file_id not in self.files:
+            raise ApiError(404, "notFound")
+        f = self.files[file_id]
+        return {**self._public(file_id), "version": str(f["version"]), "modifiedTime": "2025-01-01T00:00:00.000Z"}
+
+    def _files_generateIds(self, params, body):
+        ids = [f"gen{next(self.ids)}" for _ in range(int(self._param(params, "count", "10")))]
+        self.generated_ids.update(ids)
+        return {"kind": "drive#generatedIds", "space": self._param(params, "space", "drive"), "ids": ids}
+
+    def _files_create(self, params, body):
+        file_id = body.get("id")
+        if file_id is not None:
+            if file_id in self.files:
+                raise ApiError(409, "A file already exists with the provided ID")
+            if file_id not in self.generated_ids:
+                raise ApiError(400, "The provided file ID is not usable")
+        else:
+            file_id = f"file{next(self.ids)}"
+        parents = body.get("parents") or [self.drive_id]
+        if any(p != self.drive_id and p not in self.files for p in parents):
+            raise ApiError(404, "Parent not found")
+        self.files[file_id] = {
+            "id": file_id,
+            "name": body["name"],
+            "mimeType": body.get("mimeType", "application/octet-stream"),
+            "parents": list(parents),
+            "trashed": False,
+            "version": 1,
+        }
+        self._changed(file_id)
+        return self._public(file_id)
+
+    def _files_update(self, params, body, file_id):
+        if file_id not in self.files:
+            raise ApiError(404, "notFound")
+        f = self.files[file_id]
+        for parent in filter(None, self._param(params, "removeParents", "").split(",")):
+            f["parents"].remove(parent)
+        for parent in filter(None, self._param(params, "addParents", "").split(",")):
+            if parent != self.drive_id and parent not in self.files:
+                raise ApiError(404, "Parent not found")
+            f["parents"].append(parent)
+        for key in ("name", "trashed"):
+            if key in body:
+                f[key] = body[key]
+        f["version"] += 1
+        self._changed(file_id)
+        return self._public(file_id)
+
+    def _changes_getStartPageToken(self, params, body):
+        return {"startPageToken": str(len(self.changes))}
+
+    def _changes_list(self, params, body):
+        if self._param(params, "pageToken") is None:
+            raise ApiError(400, "pageToken is required")
+        page, next_token = self._page(params, self.changes)
+        result = {"changes": page}
+        if next_token:
+            result["nextPageToken"] = next_token
+        else:
+            result["newStartPageToken"] = str(len(self.changes))
+        return result
+
+    def _spreadsheet(self, spreadsheet_id: str) -> dict:
+        if spreadsheet_id not in self.spreadsheets:
+            raise ApiError(404, "Requested entity was not found")
+        return self.spreadsheets[spreadsheet_id]
+
+    def _spreadsheets_get(self, params, body, spreadsheet_id):
+        spreadsheet = self._spreadsheet(spreadsheet_id)
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "properties": {"title": spreadsheet["title"]},
+            "sheets": [
+                {"properties": {
+                    "title": title,
+                    "gridProperties": {"rowCount": sheet["row_count"], "columnCount": 26},
+                }}
+                for title, sheet in spreadsheet["sheets"].items()
+            ],
+        }
+
+    def _value_range(self, spreadsheet: dict, a1: str) -> dict:
+        """Rows for 'Title' or 'Title'!start:end, with trailing empty rows trimmed like the real API."""
+        m = re.fullmatch(r"'((?:[^']|'')*)'(?:!(\d+):(\d+))?", a1)
+        if not m or m[1].replace("''", "'") not in spreadsheet["sheets"]:
+            raise ApiError(400, f"Unable to parse range: {a1}")
+        rows = spreadsheet["sheets"][m[1].replace("''", "'")]["rows"]
+        if m[2]:
+            rows = rows[int(m[2]) - 1:int(m[3])]
+        while rows and not rows[-1]:
+            rows = rows[:-1]
+        result = {"range": a1, "majorDimension": "ROWS"}
+        if rows:
+            result["values"] = rows
+        return result
+
+    def _values_get(self, params, body, spreadsheet_id, a1):
+        return self._value_range(self._spreadsheet(spreadsheet_id), unquote(a1))
+
+    def _values_batchGet(self, params, body, spreadsheet_id):
+        spreadsheet = self._spreadsheet(spreadsheet_id)
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "valueRanges": [self._value_range(spreadsheet, a1) for a1 in params.get("ranges", [])],
+        }
+
+    def handle_batch(self, content_type: str, payload: bytes) -> tuple[str, bytes]:
+        """Answer a multipart/mixed batch request; returns (content type, body) of the multipart response."""
+        with self.lock:
+            self.calls["batch"] += 1
+        boundary = re.search(r'boundary="?([^";]+)', content_type)[1]
+        parts = payload.decode("utf-8").replace("\r\n", "\n").split("--" + boundary)[1:-1]
+        responses = []
+        for part in parts:
+            headers, _, request = part.lstrip("\n").partition("\n\n")
+            content_id = re.search(r"Content-ID: <(.+?)>", headers, re.I)[1]
+            request_line, _, rest = request.partition("\n")
+            method, url, _ = request_line.split(" ", 2)
+            request_body = rest.partition("\n\n")[2].strip()
+            status, result = self.handle(method, url, json.loads(request_body) if request_body else None)
+            data = json.dumps(result)
+            responses.append(
+                f"--batch_response\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data.encode())}\r\n\r\n{data}\r\n"
+            )
+        return "multipart/mixed; boundary=batch_response", ("".join(responses) + "--batch_response--\r\n").encode()
+
+
+@contextlib.contextmanager
+def serve(fake: FakeGoogle):
+    """Serve fake on a free local port for the duration of the block; yields the endpoint URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, data: bytes, content_type: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = self.rfile.read(length) if length else b""
+            if self.path.startswith("/batch/"):
+                content_type, data = fake.handle_batch(self.headers["Content-Type"], payload)
+                self._reply(200, data, content_type)
+                return
+            status, result = fake.handle(self.command, self.path, json.loads(payload) if payload else None)
+            self._reply(status, json.dumps(result).encode())
+
+        do_GET = do_POST = do_PATCH = _handle
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/"
+    finally:
+        server.shutdown()
+        server.server_close()
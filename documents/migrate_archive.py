@@ -5,17 +5,42 @@ Migrering av Bleikøya Vel-arkiv fra Dropbox til Google Drive.
 Kjør med:
     uv run documents/migrate_archive.py --dry-run    # Vis hva som vil skje
     uv run documents/migrate_archive.py              # Utfør flytting
+
+Uten Drive-mounten (f.eks. på en Linux-maskin), med en plan lagret med --save-plan:
+    uv run documents/migrate_archive.py --backend drive --apply-plan plan.jsonl
 """
 # /// script
 # requires-python = ">=3.11"
+# dependencies = [
+#     "google-api-python-client",
+#     "google-auth",
+#     "google-auth-httplib2",
+#     "httplib2",
+#     "python-dotenv",
+# ]
 # ///
 
 import argparse
+import bisect
+import contextlib
 import csv
+import functools
 import hashlib
+import itertools
+import json
+import math
+import os
+import queue
 import re
 import shutil
+import sqlite3
+import sys
+import threading
+import time
 import unicodedata
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -25,57 +50,655 @@ DRIVE = Path.home() / "Library/CloudStorage/GoogleDrive-oystein.rg@gmail.com/Del
 KILDE = DRIVE / "900 Arkiv"
 MÅL = DRIVE
 
+# Mapper i 900 Arkiv som skal migreres
+STANDARD_MAPPER = [
+    "Referat",
+    "Generalforsamling",
+    "Vårbrev, Årsberetning",
+    "Avtaler og instruks",
+    "Regnskap, budsjett",
+    "Vedtekter, informasjon til hytteeierne",
+    "Tomteinnløsning",
+    "Ulovlighetsoppfølging PBE",
+    "Frivillighetsregisteret MVA refusjon",
+    "Renovasjon",
+    "Skjøtsel, dugnad, trær, planter",
+    "Anbud",
+    "Fellesstyret for øyene",
+]
+
 # Filer/mapper som skal ignoreres
 IGNORER = {".DS_Store", "Icon\r", "Icon", ".dropbox"}
 
+# Duplikatsjekk: størrelse på blokkene i starten og slutten av filen som sammenlignes før full hash
+DELVIS_BLOKK = 64 * 1024
+# Filer opp til denne størrelsen leses helt av delvis_hash, så den delvise hashen er også full hash
+DELVIS_HELE = 2 * DELVIS_BLOKK
+# Antall filer som leses samtidig (mest venting på Drive-mounten)
+HASH_TRÅDER = 8
+
+# Hasher fra tidligere kjøringer, så nye kjøringer slipper å lese filene fra mounten igjen
+HASHCACHE_FIL = Path(__file__).parent / ".cache" / "migrering-hasher.sqlite"
+
+# Logg over planlagte og utførte flyttinger, for --resume og --rollback
+JOURNAL_FIL = Path(__file__).parent / ".cache" / "migrering-journal.jsonl"
+# Antall hendelser som skrives før journalen synkes til disk
+JOURNAL_PULJE = 100
+
+
+# Felles Path-objekt for hver mappe som forekommer i en plan; se Flytting
+_MAPPER: dict[Path, Path] = {}
+
+
+def _del_sti(sti: Path) -> tuple[Path, str]:
+    mappe = sti.parent
+    return _MAPPER.setdefault(mappe, mappe), sys.intern(sti.name)
+
 
-@dataclass
 class Flytting:
-    """Representerer en planlagt filflytting."""
-    kilde: Path
-    mål: Path
-    kategori: str
-    duplikat_av: Path | None = None  # Hvis dette er en duplikat, peker til original
-    er_identisk: bool | None = None  # True hvis innholdet er likt
+    """
+    Representerer en planlagt filflytting.
+    Stiene lagres som mappe og filnavn, der mappen er et felles objekt for alle filer i den,
+    og kategorien er internert, så en plan for hele arkivet tar lite minne.
+    kilde, mål og duplikat_av leses og settes som vanlige Path.
+    """
 
+    __slots__ = (
+        "_kilde_mappe", "_kilde_navn", "_mål_mappe", "_mål_navn",
+        "_duplikat_mappe", "_duplikat_navn", "kategori", "er_identisk",
+    )
 
-def fil_hash(path: Path) -> str:
-    """Beregner SHA-256 hash av en fil."""
+    def __init__(
+        self,
+        kilde: Path,
+        mål: Path,
+        kategori: str,
+        duplikat_av: Path | None = None,  # Hvis dette er en duplikat, peker til original
+        er_identisk: bool | None = None,  # True hvis innholdet er likt
+    ):
+        self.kilde = kilde
+        self.mål = mål
+        self.kategori = sys.intern(kategori)
+        self.duplikat_av = duplikat_av
+        self.er_identisk = er_identisk
+
+    @property
+    def kilde(self) -> Path:
+        return self._kilde_mappe / self._kilde_navn
+
+    @kilde.setter
+    def kilde(self, sti: Path) -> None:
+        self._kilde_mappe, self._kilde_navn = _del_sti(sti)
+
+    @property
+    def mål(self) -> Path:
+        return self._mål_mappe / self._mål_navn
+
+    @mål.setter
+    def mål(self, sti: Path) -> None:
+        self._mål_mappe, self._mål_navn = _del_sti(sti)
+
+    @property
+    def mål_deler(self) -> tuple[str, ...]:
+        """Delene i mål; grupperer og sorterer som mål, uten å lage en ny Path for hvert oppslag."""
+        return self._mål_mappe.parts + (self._mål_navn,)
+
+    @property
+    def duplikat_av(self) -> Path | None:
+        return None if self._duplikat_mappe is None else self._duplikat_mappe / self._duplikat_navn
+
+    @duplikat_av.setter
+    def duplikat_av(self, sti: Path | None) -> None:
+        self._duplikat_mappe, self._duplikat_navn = (None, None) if sti is None else _del_sti(sti)
+
+    def _felter(self) -> tuple:
+        return self.kilde, self.mål, self.kategori, self.duplikat_av, self.er_identisk
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._felter() == other._felter()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        kilde, mål, kategori, duplikat_av, er_identisk = self._felter()
+        return (f"Flytting(kilde={kilde!r}, mål={mål!r}, kategori={kategori!r}, "
+                f"duplikat_av={duplikat_av!r}, er_identisk={er_identisk!r})")
+
+
+class Hashcache:
+    """
+    Lagrer hasher i SQLite, nøklet på sti, størrelse, mtime og inode.
+    En fil som er endret eller byttet ut siden sist stemmer ikke med lagret stat og hashes på nytt.
+    """
+
+    def __init__(self, sti: Path):
+        sti.parent.mkdir(parents=True, exist_ok=True)
+        self.lås = threading.Lock()
+        self.db = sqlite3.connect(sti, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS hasher (
+                sti TEXT NOT NULL,
+                type TEXT NOT NULL,
+                størrelse INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (sti, type)
+            )
+        """)
+
+    def hent(self, sti: Path, type: str, st) -> str | None:
+        with self.lås:
+            rad = self.db.execute(
+                "SELECT størrelse, mtime_ns, inode, hash FROM hasher WHERE sti = ? AND type = ?",
+                (str(sti), type),
+            ).fetchone()
+        if rad and rad[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return rad[3]
+        return None
+
+    def lagre(self, sti: Path, type: str, st, verdi: str) -> None:
+        with self.lås, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO hasher VALUES (?, ?, ?, ?, ?, ?)",
+                (str(sti), type, st.st_size, st.st_mtime_ns, st.st_ino, verdi),
+            )
+
+
+# Settes i main(); None betyr at alle hasher beregnes på nytt
+HASHCACHE: Hashcache | None = None
+
+# Øvre grenser i millisekunder for bøttene i histogrammene til Profil
+HISTOGRAM_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Profil:
+    """
+    Tidtaking og tellere for --profile, så en treg kjøring kan spores til mounten, hashingen eller klassifiseringen.
+    Faser summeres over trådene de kjører i, så faser i trådpooler kan vare lenger enn hele kjøringen.
+    Ventetider samles i histogrammer med faste bøtter. Med trace lagres også hver fase og hver måling
+    som hendelser for en Chrome-trace (chrome://tracing eller ui.perfetto.dev).
+    """
+
+    def __init__(self, json_fil: Path | None = None, trace_fil: Path | None = None):
+        self.json_fil = json_fil
+        self.trace_fil = trace_fil
+        self.start = time.perf_counter()
+        self.lås = threading.Lock()
+        self.tellere: Counter = Counter()
+        self.faser: dict[str, list[float]] = {}  # navn -> [antall, sekunder]
+        self.histogrammer: dict[str, list] = {}  # navn -> [antall per bøtte, antall, sum, maks]
+        self.hendelser: list[dict] | None = [] if trace_fil else None
+        self.tråder: dict[int, str] = {}
+
+    def _hendelse(self, navn: str, start: float, slutt: float) -> None:
+        # Kalles med låsen
+        tråd = threading.current_thread()
+        self.tråder[tråd.ident] = tråd.name
+        self.hendelser.append({
+            "name": navn, "ph": "X", "pid": os.getpid(), "tid": tråd.ident,
+            "ts": (start - self.start) * 1e6, "dur": (slutt - start) * 1e6,
+        })
+
+    @contextlib.contextmanager
+    def fase(self, navn: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            slutt = time.perf_counter()
+            with self.lås:
+                fase = self.faser.setdefault(navn, [0, 0.0])
+                fase[0] += 1
+                fase[1] += slutt - start
+                if self.hendelser is not None:
+                    self._hendelse(navn, start, slutt)
+
+    def tell(self, navn: str, antall: int = 1) -> None:
+        with self.lås:
+            self.tellere[navn] += antall
+
+    def mål(self, navn: str, start: float) -> None:
+        """Legger tiden siden start (fra time.perf_counter) til histogrammet navn."""
+        slutt = time.perf_counter()
+        ms = (slutt - start) * 1000
+        with self.lås:
+            histogram = self.histogrammer.setdefault(navn, [[0] * (len(HISTOGRAM_MS) + 1), 0, 0.0, 0.0])
+            histogram[0][bisect.bisect_left(HISTOGRAM_MS, ms)] += 1
+            histogram[1] += 1
+            histogram[2] += ms
+            histogram[3] = max(histogram[3], ms)
+            if self.hendelser is not None:
+                self._hendelse(navn, start, slutt)
+
+    @staticmethod
+    def _persentil(bøtter: list[int], antall: int, andel: float) -> float:
+        """Øvre grense for bøtta persentilen havner i; siste bøtte er uten grense."""
+        sett = 0
+        for grense, n in zip([*HISTOGRAM_MS, math.inf], bøtter):
+            sett += n
+            if sett >= andel * antall:
+                return grense
+        return math.inf
+
+    def oppsummering(self) -> dict:
+        with self.lås:
+            varighet = time.perf_counter() - self.start
+            faser = {navn: {"antall": n, "sekunder": round(s, 6)} for navn, (n, s) in self.faser.items()}
+            histogrammer = {}
+            for navn, (bøtter, antall, summ, maks) in self.histogrammer.items():
+                histogrammer[navn] = {
+                    "antall": antall,
+                    "snitt_ms": round(summ / antall, 3),
+                    **{f"p{p}_ms": self._persentil(bøtter, antall, p / 100) for p in (50, 90, 99)},
+                    "maks_ms": round(maks, 3),
+                    "bøtter": {f"≤{grense}ms": n for grense, n in zip(HISTOGRAM_MS, bøtter)} | {"mer": bøtter[-1]},
+                }
+            tellere = dict(self.tellere)
+
+        rater = {}
+        if "planlegg" in faser and tellere.get("filer klassifisert"):
+            rater["filer planlagt per sekund"] = round(tellere["filer klassifisert"] / faser["planlegg"]["sekunder"], 1)
+        hashtid = sum(h["snitt_ms"] * h["antall"] for navn, h in histogrammer.items() if navn.startswith("hash"))
+        if hashtid and tellere.get("byte hashet"):
+            rater["MB hashet per trådsekund"] = round(tellere["byte hashet"] / 1e6 / (hashtid / 1000), 1)
+        if "utfør" in faser and tellere.get("flyttet"):
+            rater["filer flyttet per sekund"] = round(tellere["flyttet"] / faser["utfør"]["sekunder"], 1)
+
+        # Uendelige persentiler er ikke gyldig JSON
+        for histogram in histogrammer.values():
+            for nøkkel, verdi in histogram.items():
+                if verdi == math.inf:
+                    histogram[nøkkel] = None
+        return {
+            "varighet_sekunder": round(varighet, 3),
+            "faser": faser,
+            "tellere": tellere,
+            "rater": rater,
+            "histogrammer": histogrammer,
+        }
+
+    def skriv(self) -> None:
+        """Skriver oppsummeringen, og Chrome-tracen hvis den er slått på, og viser hovedtallene."""
+        oppsummering = self.oppsummering()
+
+        print(f"\n{'='*60}")
+        print(f"PROFIL ({oppsummering['varighet_sekunder']:.1f} s)")
+        print(f"{'='*60}\n")
+        for navn, fase in oppsummering["faser"].items():
+            print(f"  {navn:<28}{fase['sekunder']:>9.2f} s{fase['antall']:>9}×")
+        for navn, antall in oppsummering["tellere"].items():
+            print(f"  {navn:<28}{antall:>12}")
+        for navn, rate in oppsummering["rater"].items():
+            print(f"  {navn:<28}{rate:>12}")
+        for navn, histogram in oppsummering["histogrammer"].items():
+            print(f"  {navn:<28} p50 ≤{histogram['p50_ms']} ms, p99 ≤{histogram['p99_ms']} ms, maks {histogram['maks_ms']} ms")
+
+        if self.json_fil:
+            self.json_fil.write_text(json.dumps(oppsummering, indent=2, ensure_ascii=False), encoding="utf-8")
+            print(f"\n✅ Profil lagret til {self.json_fil}")
+        if self.trace_fil:
+            with self.lås:
+                navn = [
+                    {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": trådnavn}}
+                    for tid, trådnavn in self.tråder.items()
+                ]
+                hendelser = navn + self.hendelser
+            self.trace_fil.write_text(json.dumps({"traceEvents": hendelser}), encoding="utf-8")
+            print(f"✅ Trace lagret til {self.trace_fil}")
+        print()
+
+
+class _IngenProfil:
+    """Brukes uten --profile; alle kall gjør ingenting, så instrumenteringen koster nesten ingenting."""
+
+    _ingenting = contextlib.nullcontext()
+
+    def fase(self, navn: str) -> contextlib.nullcontext:
+        return self._ingenting
+
+    def tell(self, navn: str, antall: int = 1) -> None:
+        pass
+
+    def mål(self, navn: str, start: float) -> None:
+        pass
+
+    def skriv(self) -> None:
+        pass
+
+
+# Settes i main() med --profile eller --trace
+PROFIL: Profil | _IngenProfil = _IngenProfil()
+
+
+def _hash_med_cache(path: Path, type: str, beregn) -> str:
+    """Slår opp hashen i HASHCACHE før filen leses."""
+    if HASHCACHE is None:
+        return _beregn_hash(path, type, beregn)
+
+    st = _stat_kall(path)
+    verdi = HASHCACHE.hent(path, type, st)
+    if verdi is None:
+        verdi = _beregn_hash(path, type, beregn)
+        HASHCACHE.lagre(path, type, st, verdi)
+    else:
+        PROFIL.tell("hashcache-treff")
+    return verdi
+
+
+def _beregn_hash(path: Path, type: str, beregn) -> str:
+    start = time.perf_counter()
+    verdi = beregn(path)
+    PROFIL.mål(f"hash ({type})", start)
+    return verdi
+
+
+def _sha256(path: Path) -> str:
+    with open(path, "rb") as f:
+        verdi = hashlib.file_digest(f, "sha256").hexdigest()
+        PROFIL.tell("byte hashet", f.tell())
+    return verdi
+
+
+def _delvis_sha256(path: Path) -> str:
     h = hashlib.sha256()
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
+        blokk = f.read(DELVIS_BLOKK)
+        h.update(blokk)
+        lest = len(blokk)
+        størrelse = f.seek(0, 2)
+        if størrelse > DELVIS_BLOKK:
+            f.seek(max(DELVIS_BLOKK, størrelse - DELVIS_BLOKK))
+            blokk = f.read(DELVIS_BLOKK)
+            h.update(blokk)
+            lest += len(blokk)
+    PROFIL.tell("byte hashet", lest)
     return h.hexdigest()
 
 
+def _stat_kall(sti: Path) -> os.stat_result:
+    PROFIL.tell("stat-kall")
+    return sti.stat()
+
+
+def _størrelse(sti: Path) -> int:
+    return _stat_kall(sti).st_size
+
+
+def fil_hash(path: Path) -> str:
+    """Beregner SHA-256 hash av en fil."""
+    return _hash_med_cache(path, "full", _sha256)
+
+
+def delvis_hash(path: Path) -> str:
+    """Billig SHA-256 av første og siste blokk i filen, for å skille ut ulike filer før full hash."""
+    return _hash_med_cache(path, "delvis", _delvis_sha256)
+
+
+def _for_alle(funksjon, stier) -> dict[Path, object]:
+    """Kjører funksjon på hver unike sti i en trådpool og returnerer {sti: resultat}."""
+    unike = list(dict.fromkeys(stier))
+    with ThreadPoolExecutor(max_workers=HASH_TRÅDER) as pool:
+        return dict(zip(unike, pool.map(funksjon, unike)))
+
+
 def finn_duplikater(flyttinger: list[Flytting]) -> list[Flytting]:
-    """Identifiserer duplikater og sjekker om de har likt innhold."""
+    """
+    Identifiserer duplikater og sjekker om de har likt innhold.
+    Sammenligner i tre trinn, slik at bare filer som ser like ut leses i sin helhet:
+    filstørrelse, så hash av start og slutt, så full SHA-256.
+    """
     # Grupper etter målsti
-    mål_til_kilder: dict[Path, list[Flytting]] = {}
+    mål_til_kilder: dict[tuple[str, ...], list[Flytting]] = {}
     for f in flyttinger:
-        mål_til_kilder.setdefault(f.mål, []).append(f)
+        mål_til_kilder.setdefault(f.mål_deler, []).append(f)
+
+    par = [
+        (kilder[0], duplikat)
+        for kilder in mål_til_kilder.values()
+        if len(kilder) > 1
+        for duplikat in kilder[1:]
+    ]
+
+    # Trinn 1: ulik størrelse betyr ulikt innhold
+    with PROFIL.fase("duplikater: størrelse"):
+        størrelser = _for_alle(_størrelse, [f.kilde for par_ in par for f in par_])
+    kandidater = [(o, d) for o, d in par if størrelser[o.kilde] == størrelser[d.kilde]]
+
+    # Trinn 2: start og slutt av filen
+    with PROFIL.fase("duplikater: delvis hash"):
+        delvise = _for_alle(delvis_hash, [f.kilde for par_ in kandidater for f in par_])
+    kandidater = [(o, d) for o, d in kandidater if delvise[o.kilde] == delvise[d.kilde]]
+
+    # Trinn 3: full hash av de som gjenstår, utenom små filer der den delvise hashen dekket hele filen
+    store = [(o, d) for o, d in kandidater if størrelser[o.kilde] > DELVIS_HELE]
+    with PROFIL.fase("duplikater: full hash"):
+        hasher = _for_alle(fil_hash, [f.kilde for par_ in store for f in par_])
+    identiske = {
+        id(d) for o, d in kandidater
+        if størrelser[o.kilde] <= DELVIS_HELE or hasher[o.kilde] == hasher[d.kilde]
+    }
 
-    # Sjekk duplikater
     resultat = []
-    for mål, kilder in mål_til_kilder.items():
-        if len(kilder) == 1:
-            resultat.append(kilder[0])
-        else:
-            # Flere kilder til samme mål - sjekk hash
-            original = kilder[0]
-            original_hash = fil_hash(original.kilde)
-            resultat.append(original)
-
-            for duplikat in kilder[1:]:
-                duplikat_hash = fil_hash(duplikat.kilde)
-                er_identisk = duplikat_hash == original_hash
-                duplikat.duplikat_av = original.kilde
-                duplikat.er_identisk = er_identisk
-                resultat.append(duplikat)
+    for kilder in mål_til_kilder.values():
+        original = kilder[0]
+        resultat.append(original)
+        for duplikat in kilder[1:]:
+            duplikat.duplikat_av = original.kilde
+            duplikat.er_identisk = id(duplikat) in identiske
+            resultat.append(duplikat)
 
     return resultat
 
 
+def likt_innhold(a: Path, b: Path) -> bool:
+    """Sammenligner to filer i de samme tre trinnene som finn_duplikater."""
+    størrelse = _størrelse(a)
+    if størrelse != _størrelse(b):
+        return False
+    if delvis_hash(a) != delvis_hash(b):
+        return False
+    return størrelse <= DELVIS_HELE or fil_hash(a) == fil_hash(b)
+
+
+# Antall filer som hashes per runde i finn_innholdsduplikater; begrenser minnebruken
+INNHOLD_RUNDE = 512
+
+
+def _filer_i_mål() -> Iterator[Path]:
+    """Eksisterende filer i målet, utenom kildearkivet selv, etter hvert som mappene leses."""
+    for oppføring in MÅL.iterdir():
+        if oppføring == KILDE or oppføring.name in IGNORER or oppføring.name.startswith("~$"):
+            continue
+        if oppføring.is_dir():
+            yield from samle_filer(oppføring)
+        elif oppføring.is_file():
+            yield oppføring
+
+
+def _med_størrelse(filer: Iterable[tuple[int, Path]]) -> Iterator[tuple[int, str, int]]:
+    """Gir (nr, sti, størrelse) fortløpende; stat kjøres i trådpoolen, INNHOLD_RUNDE filer om gangen."""
+    filer = iter(filer)
+    with ThreadPoolExecutor(max_workers=HASH_TRÅDER) as pool:
+        while runde := list(itertools.islice(filer, INNHOLD_RUNDE)):
+            for (nr, sti), størrelse in zip(runde, pool.map(_størrelse, [sti for _, sti in runde])):
+                yield nr, str(sti), størrelse
+
+
+def finn_innholdsduplikater(flyttinger: list[Flytting]) -> None:
+    """
+    Finner filer med identisk innhold uansett navn og plassering, også mot filer som allerede ligger i målet.
+    Kilder som er identiske med en eksisterende fil i målet, eller med en tidligere kilde, markeres som
+    identiske duplikater og hoppes over. Indeksen ligger i en midlertidig SQLite-fil og fylles og
+    behandles i runder, så minnebruken er begrenset også for hele arkivet.
+    """
+    db = sqlite3.connect("")  # Midlertidig database på disk, slettes ved close()
+    # nr er indeks i flyttinger, -1 for filer som allerede ligger i målet
+    db.execute("CREATE TABLE filer (nr INTEGER NOT NULL, sti TEXT NOT NULL, størrelse INTEGER NOT NULL)")
+
+    kandidater = (
+        (nr, f.kilde)
+        for nr, f in enumerate(flyttinger)
+        if not (f.duplikat_av is not None and f.er_identisk)
+    )
+    db.executemany("INSERT INTO filer VALUES (?, ?, ?)", _med_størrelse(kandidater))
+    eksisterende = ((-1, sti) for sti in _filer_i_mål())
+    db.executemany("INSERT INTO filer VALUES (?, ?, ?)", _med_størrelse(eksisterende))
+    db.execute("CREATE INDEX filer_størrelse ON filer (størrelse, nr)")
+
+    def behandle(grupper: list[tuple[int, list[tuple[int, Path]]]]) -> None:
+        stier = [sti for _, gruppe in grupper for _, sti in gruppe]
+        delvise = _for_alle(delvis_hash, stier)
+        # Bare filer som deler delvis hash med en annen i samme størrelsesgruppe trenger full hash,
+        # og bare hvis de er større enn det delvis_hash leser
+        hasher: dict[Path, str] = {}
+        like_delvise = []
+        for størrelse, gruppe in grupper:
+            antall = Counter(delvise[sti] for _, sti in gruppe)
+            like = [sti for _, sti in gruppe if antall[delvise[sti]] > 1]
+            if størrelse <= DELVIS_HELE:
+                hasher.update((sti, delvise[sti]) for sti in like)
+            else:
+                like_delvise.extend(like)
+        hasher.update(_for_alle(fil_hash, like_delvise))
+
+        for _, gruppe in grupper:
+            # Eksisterende filer i målet først, deretter kildene i planlagt rekkefølge
+            beholdt: dict[str, Path] = {}
+            for nr, sti in gruppe:
+                if sti not in hasher:
+                    continue
+                original = beholdt.setdefault(hasher[sti], sti)
+                if original != sti:
+                    flyttinger[nr].duplikat_av = original
+                    flyttinger[nr].er_identisk = True
+
+    # Bare størrelser med minst to filer, hvorav minst én kilde, kan gi duplikater.
+    # Tomme filer er plassholdere og regnes ikke som like.
+    runde: list[tuple[int, list[tuple[int, Path]]]] = []
+    størrelser = db.execute("""
+        SELECT størrelse FROM filer WHERE størrelse > 0 GROUP BY størrelse
+        HAVING COUNT(*) > 1 AND MAX(nr) >= 0
+    """)
+    for (størrelse,) in størrelser:
+        gruppe = [
+            (nr, Path(sti))
+            for nr, sti in db.execute("SELECT nr, sti FROM filer WHERE størrelse = ? ORDER BY nr", (størrelse,))
+        ]
+        runde.append((størrelse, gruppe))
+        if sum(len(g) for _, g in runde) >= INNHOLD_RUNDE:
+            behandle(runde)
+            runde = []
+    if runde:
+        behandle(runde)
+
+    db.close()
+
+
+def _kort(sti: Path) -> Path:
+    """Sti relativt til kildearkivet, eller til målet for filer som allerede ligger der."""
+    return sti.relative_to(KILDE) if sti.is_relative_to(KILDE) else sti.relative_to(MÅL)
+
+
+_SIFFERLØP = re.compile(r"\d+")
+_DATOPREFIKS = re.compile(r"^(\d{4})[-\s](\d{2})[-\s](\d{2})(.*)$")
+_DATOPREFIKS_VALGFRI = re.compile(r"^\d{4}(-\d{2}){0,2}\s+")
+_DATOPREFIKS_OG_TEKST = re.compile(r"^(\d{4}(?:-\d{2}){0,2}\s+)?(.+)$")
+
+
+@dataclass
+class _Datoer:
+    """
+    Dato- og årstallskandidatene i en tekst, fra én gjennomgang av sifferløpene.
+    Hver kandidat er første forekomst av sitt mønster, som tallstrenger uten validering.
+    """
+    løp: list[tuple[int, int]]                      # (start, slutt) for hvert sammenhengende sifferløp
+    prefiks_dato: bool = False                      # YYYY-MM-DD / YYYY MM DD helt først
+    prefiks_år: bool = False                        # YYYY og mellomrom helt først
+    kompakt: tuple[str, str, str] | None = None     # YYYYMMDD som eget sifferløp
+    punktum: tuple[str, str, str] | None = None     # DD.MM.YYYY / DD.MM.YY (dag, mnd, år)
+    bindestrek: tuple[str, str, str] | None = None  # YYYY-MM-DD
+    år: str | None = None                           # YYYY alene, 2000-2030, ikke del av YYYY-YYYY
+
+
+def _er_skille(tegn: str, understrek: bool = False) -> bool:
+    return tegn == "-" or tegn.isspace() or (understrek and tegn == "_")
+
+
+@functools.lru_cache(maxsize=65536)
+def _finn_datoer(tekst: str) -> _Datoer:
+    """Deler teksten i sifferløp én gang og leser datomønstrene ut av løpene og tegnene mellom dem."""
+    løp = [m.span() for m in _SIFFERLØP.finditer(tekst)]
+    datoer = _Datoer(løp)
+    if not løp:
+        return datoer
+
+    if løp[0] == (0, 4):
+        datoer.prefiks_år = tekst[4:5].isspace()
+        datoer.prefiks_dato = (
+            len(løp) >= 3 and løp[1] == (5, 7) and løp[2][0] == 8 and løp[2][1] >= 10
+            and _er_skille(tekst[4]) and _er_skille(tekst[7])
+        )
+
+    forrige_slutt = forrige_lengde = -2
+    for j, (a, b) in enumerate(løp):
+        etter = tekst[b:b + 1]
+
+        if b - a == 8 and not datoer.kompakt:
+            datoer.kompakt = tekst[a:a + 4], tekst[a + 4:a + 6], tekst[a + 6:b]
+
+        elif b - a == 4 and not datoer.år and 2000 <= int(tekst[a:b]) <= 2030:
+            # Hopp over årstallsområder som 2017-2018, både start og slutt
+            slutt_på_område = a == forrige_slutt + 1 and tekst[a - 1] == "-" and forrige_lengde >= 4
+            start_på_område = (
+                etter == "-" and j + 1 < len(løp) and løp[j + 1][0] == b + 1 and løp[j + 1][1] - løp[j + 1][0] >= 4
+            )
+            if not slutt_på_område and not start_på_område:
+                datoer.år = tekst[a:b]
+
+        # Tre løp etter hverandre med samme skilletegn mellom: DD.MM.YYYY eller YYYY-MM-DD
+        if (etter == "." or etter == "-") and j + 2 < len(løp):
+            (a2, b2), (a3, b3) = løp[j + 1], løp[j + 2]
+            if a2 == b + 1 and a3 == b2 + 1 and tekst[b2] == etter and b3 - a3 >= 2:
+                if etter == "." and b2 - a2 <= 2 and not datoer.punktum:
+                    datoer.punktum = tekst[max(a, b - 2):b], tekst[a2:b2], tekst[a3:min(b3, a3 + 4)]
+                elif etter == "-" and b - a >= 4 and b2 - a2 == 2 and not datoer.bindestrek:
+                    datoer.bindestrek = tekst[b - 4:b], tekst[a2:b2], tekst[a3:a3 + 2]
+
+        forrige_slutt, forrige_lengde = b, b - a
+
+    return datoer
+
+
+def _to_siffer(tekst: str, løp: list[tuple[int, int]], pos: int, j: int) -> tuple[str, int, int] | None:
+    """To siffer fra pos (rett etter et siffer i løp j), eventuelt etter ett skilletegn."""
+    b = løp[j][1]
+    if pos < b:
+        return (tekst[pos:pos + 2], pos + 2, j) if pos + 2 <= b else None
+    if j + 1 < len(løp) and løp[j + 1][0] == pos + 1 and løp[j + 1][1] - pos > 2 and _er_skille(tekst[pos], understrek=True):
+        return tekst[pos + 1:pos + 3], pos + 3, j + 1
+    return None
+
+
+def _skilt_dato(tekst: str, løp: list[tuple[int, int]]) -> tuple[str, str, str] | None:
+    """Første YYYY[-_ ]MM[-_ ]DD i teksten, der skilletegnene er valgfrie."""
+    for j, (a, b) in enumerate(løp):
+        for p in range(a, b - 3):
+            mnd = _to_siffer(tekst, løp, p + 4, j)
+            dag = mnd and _to_siffer(tekst, løp, mnd[1], mnd[2])
+            if dag:
+                return tekst[p:p + 4], mnd[0], dag[0]
+    return None
+
+
+def _gyldig(mnd: str, dag: str) -> bool:
+    return 1 <= int(mnd) <= 12 and 1 <= int(dag) <= 31
+
+
 def ekstraher_og_prefiks_dato(navn: str) -> str:
     """
     Finner dato i filnavnet og legger den til som prefiks.
@@ -84,60 +707,41 @@ def ekstraher_og_prefiks_dato(navn: str) -> str:
     Ignorerer årstallsområder som 2017-2018.
     """
     stem, ext = navn.rsplit(".", 1) if "." in navn else (navn, "")
+    datoer = _finn_datoer(stem)
 
     # Allerede har dato-prefiks? Bare normaliser formatet
-    if re.match(r"^\d{4}[-\s]\d{2}[-\s]\d{2}", stem):
+    if datoer.prefiks_dato:
         # Normaliser til YYYY-MM-DD
-        m = re.match(r"^(\d{4})[-\s](\d{2})[-\s](\d{2})(.*)$", stem)
+        m = _DATOPREFIKS.match(stem)
         if m:
             stem = f"{m.group(1)}-{m.group(2)}-{m.group(3)}{m.group(4)}"
         return f"{stem}.{ext}" if ext else stem
 
     # Allerede har årstall-prefiks? Behold som det er
-    if re.match(r"^\d{4}\s", stem):
+    if datoer.prefiks_år:
         return f"{stem}.{ext}" if ext else stem
 
     dato = None
 
     # YYYYMMDD (uten bindestrek, f.eks. 20180528)
-    m = re.search(r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)", stem)
-    if m:
-        år, mnd, dag = m.groups()
-        if 1 <= int(mnd) <= 12 and 1 <= int(dag) <= 31:
-            dato = f"{år}-{mnd}-{dag}"
+    if datoer.kompakt and _gyldig(datoer.kompakt[1], datoer.kompakt[2]):
+        dato = "-".join(datoer.kompakt)
 
     # DD.MM.YYYY eller DD.MM.YY
-    if not dato:
-        m = re.search(r"(\d{1,2})\.(\d{1,2})\.(\d{2,4})", stem)
-        if m:
-            dag, mnd, år = m.groups()
-            if len(år) == 2:
-                år = "20" + år
-            if 1 <= int(mnd) <= 12 and 1 <= int(dag) <= 31:
-                dato = f"{år}-{mnd.zfill(2)}-{dag.zfill(2)}"
+    if not dato and datoer.punktum:
+        dag, mnd, år = datoer.punktum
+        if len(år) == 2:
+            år = "20" + år
+        if _gyldig(mnd, dag):
+            dato = f"{år}-{mnd.zfill(2)}-{dag.zfill(2)}"
 
     # YYYY-MM-DD (med bindestrek, men ikke YYYY-YYYY årstallsområde)
-    if not dato:
-        m = re.search(r"(\d{4})-(\d{2})-(\d{2})", stem)
-        if m:
-            år, mnd, dag = m.groups()
-            if 1 <= int(mnd) <= 12 and 1 <= int(dag) <= 31:
-                dato = f"{år}-{mnd}-{dag}"
+    if not dato and datoer.bindestrek and _gyldig(datoer.bindestrek[1], datoer.bindestrek[2]):
+        dato = "-".join(datoer.bindestrek)
 
     # Bare YYYY (årstall alene, men IKKE del av YYYY-YYYY område)
     if not dato:
-        for m in re.finditer(r"(?<!\d)(\d{4})(?!\d)", stem):
-            år = m.group(1)
-            if 2000 <= int(år) <= 2030:
-                # Sjekk om det er del av et YYYY-YYYY område
-                før = stem[max(0, m.start()-1):m.start()]
-                etter = stem[m.end():m.end()+5]
-                if før == "-" and re.match(r"\d{4}", stem[m.start()-5:m.start()-1] if m.start() >= 5 else ""):
-                    continue  # Slutten av et område (f.eks. "-2018" i "2017-2018")
-                if etter.startswith("-") and re.match(r"\d{4}", etter[1:5]):
-                    continue  # Starten av et område (f.eks. "2017-" i "2017-2018")
-                dato = år
-                break
+        dato = datoer.år
 
     if dato:
         # Legg til dato som prefiks, behold resten av filnavnet uendret
@@ -146,6 +750,7 @@ def ekstraher_og_prefiks_dato(navn: str) -> str:
     return f"{stem}.{ext}" if ext else stem
 
 
+@functools.lru_cache(maxsize=65536)
 def normaliser_filnavn(navn: str) -> str:
     """Fjern unødvendige tegn og normaliser filnavn."""
     # Fjern usynlige tegn
@@ -159,13 +764,13 @@ def normaliser_filnavn(navn: str) -> str:
     stem, ext = navn.rsplit(".", 1) if "." in navn else (navn, "")
 
     # Fjern eventuell dato-prefix for å sjekke teksten
-    tekst = re.sub(r"^\d{4}(-\d{2}){0,2}\s+", "", stem)
+    tekst = _DATOPREFIKS_VALGFRI.sub("", stem)
 
     # Hvis teksten er hovedsakelig UPPERCASE (mer enn 70% store bokstaver)
-    bokstaver = [c for c in tekst if c.isalpha()]
-    if bokstaver and sum(1 for c in bokstaver if c.isupper()) / len(bokstaver) > 0.7:
+    bokstaver = list(filter(str.isalpha, tekst))
+    if bokstaver and sum(map(str.isupper, bokstaver)) / len(bokstaver) > 0.7:
         # Behold dato-prefix, konverter resten til sentence case
-        dato_match = re.match(r"^(\d{4}(?:-\d{2}){0,2}\s+)?(.+)$", stem)
+        dato_match = _DATOPREFIKS_OG_TEKST.match(stem)
         if dato_match:
             prefix = dato_match.group(1) or ""
             tekst = dato_match.group(2).capitalize()
@@ -175,17 +780,19 @@ def normaliser_filnavn(navn: str) -> str:
     return navn
 
 
+@functools.lru_cache(maxsize=65536)
 def ekstraher_dato(filnavn: str) -> str | None:
     """Prøv å ekstrahere dato fra filnavn og returner YYYY-MM-DD format."""
+    datoer = _finn_datoer(filnavn)
+
     # Mønster: YYYY-MM-DD, YYYY MM DD, YYYYMMDD
-    m = re.search(r"(\d{4})[-\s_]?(\d{2})[-\s_]?(\d{2})", filnavn)
-    if m:
-        return f"{m.group(1)}-{m.group(2)}-{m.group(3)}"
+    skilt = _skilt_dato(filnavn, datoer.løp)
+    if skilt:
+        return "-".join(skilt)
 
     # Mønster: DD.MM.YYYY eller DD.MM.YY
-    m = re.search(r"(\d{1,2})\.(\d{1,2})\.(\d{2,4})", filnavn)
-    if m:
-        dag, mnd, år = m.groups()
+    if datoer.punktum:
+        dag, mnd, år = datoer.punktum
         if len(år) == 2:
             år = "20" + år
         return f"{år}-{mnd.zfill(2)}-{dag.zfill(2)}"
@@ -193,216 +800,337 @@ def ekstraher_dato(filnavn: str) -> str | None:
     return None
 
 
-def bestem_målmappe(kilde: Path, relativ_sti: Path) -> tuple[Path, str] | None:
+class _Nøkkelordsøk:
     """
-    Bestemmer målmappe basert på kildefil.
-    Returnerer (målsti, kategori) eller None hvis filen skal hoppes over.
+    Finner alle forekomster av nøkkelordene i REGLER med ett samlet, forhåndskompilert regulært uttrykk.
+    Søket starter på nytt rett etter hvert treff, så overlappende forekomster også blir med.
+    På hver posisjon treffer det lengste nøkkelordet; kortere nøkkelord som starter likt
+    (f.eks. "general" i "generalforsamling") legges til fra en ferdigberegnet tabell.
     """
-    # Normaliser Unicode (macOS bruker ofte NFD, Python-strenger er NFC)
-    filnavn = unicodedata.normalize("NFC", kilde.name)
-    mappenavn = unicodedata.normalize("NFC", relativ_sti.parts[0]) if relativ_sti.parts else ""
-    undermapper = tuple(unicodedata.normalize("NFC", p) for p in relativ_sti.parts[1:-1]) if len(relativ_sti.parts) > 1 else ()
-
-    filnavn_lower = filnavn.lower()
-
-    # === MVA/FRIVILLIGHETSREGISTERET -> 500-prosjekt (tidlig for å fange alle filer) ===
-    if "mva" in mappenavn.lower() or "frivillighetsregister" in mappenavn.lower():
-        understi = Path(*relativ_sti.parts[1:-1]) if len(relativ_sti.parts) > 1 else Path()
-        return MÅL / "502 2024 MVA-refusjon" / understi / normaliser_filnavn(filnavn), "MVA-refusjon"
-
-    # === STYREMØTER -> 021 Styremøter (flatt med møtemapper) ===
-    if "styrereferat" in filnavn_lower or "referat styremøte" in filnavn_lower:
-        dato = ekstraher_dato(filnavn)
-        if dato:
-            # Formater dato som "4. november 2025" for lesbarhet
-            år, mnd, dag = dato.split("-")
-            måneder = ["januar", "februar", "mars", "april", "mai", "juni",
-                      "juli", "august", "september", "oktober", "november", "desember"]
-            dato_lesbar = f"{int(dag)}. {måneder[int(mnd)-1]} {år}"
-
-            # Mappe: 2025-11-04 Styremøte 4. november 2025
-            møtemappe = f"{dato} Styremøte {dato_lesbar}"
-            # Fil: normaliser_filnavn håndterer dato-prefiks
-            return MÅL / "021 Styremøter" / møtemappe / normaliser_filnavn(filnavn), "Styrereferat"
-        else:
-            # Fallback hvis ingen dato funnet
-            return MÅL / "021 Styremøter" / "_usortert" / normaliser_filnavn(filnavn), "Styrereferat"
-
-    # === GENERALFORSAMLING -> 010 Generalforsamling ===
-    if any(x in filnavn_lower for x in ["generalforsamling", "protokoll gf", "protokoll fra gf"]):
-        år = None
-        for part in list(undermapper) + [mappenavn, filnavn]:
-            m = re.search(r"20\d{2}", part)
-            if m:
-                år = m.group()
-                break
-
-        if år:
-            return MÅL / "010 Generalforsamling" / f"{år} Generalforsamling" / normaliser_filnavn(filnavn), "Generalforsamling"
-
-    # === MEDLEMSMØTE -> 010 Generalforsamling ===
-    if "medlemsmøte" in filnavn_lower:
-        år = None
-        for part in list(undermapper) + [mappenavn, filnavn]:
-            m = re.search(r"20\d{2}", part)
-            if m:
-                år = m.group()
-                break
-
-        if år:
-            return MÅL / "010 Generalforsamling" / f"{år} Generalforsamling" / normaliser_filnavn(filnavn), "Medlemsmøte"
-
-    # === INNKALLING -> 010 Generalforsamling ===
-    if "innkalling" in filnavn_lower and "general" in filnavn_lower:
-        år = None
-        for part in list(undermapper) + [mappenavn, filnavn]:
-            m = re.search(r"20\d{2}", part)
-            if m:
-                år = m.group()
-                break
-
-        if år:
-            return MÅL / "010 Generalforsamling" / f"{år} Generalforsamling" / normaliser_filnavn(filnavn), "Innkalling GF"
-
-    # === ÅRSBERETNING -> 010 Generalforsamling (årsberetning for år X -> GF X+1) ===
-    if "årsberetning" in filnavn_lower:
-        år = None
-        m = re.search(r"20\d{2}", filnavn)
-        if m:
-            år = m.group()
-        if år:
-            gf_år = str(int(år) + 1)  # Årsberetning 2023 -> GF 2024
-            return MÅL / "010 Generalforsamling" / f"{gf_år} Generalforsamling" / normaliser_filnavn(filnavn), "Årsberetning"
-
-    # === FELLESSTYRET -> 090 Fellesstyret ===
-    if "fellesstyret" in filnavn_lower or "fellestyret" in filnavn_lower or "fellesstyret" in mappenavn.lower():
-        nytt_navn = normaliser_filnavn(filnavn)
-        # Behold undermappe-struktur hvis relevant
-        if "fellesstyret" in mappenavn.lower() and len(undermapper) > 0:
-            undermappe = undermapper[0]
-            return MÅL / "090 Fellesstyret" / undermappe / nytt_navn, "Fellesstyret"
-        return MÅL / "090 Fellesstyret" / nytt_navn, "Fellesstyret"
-
-    # === SAKSLISTE / VALGKOMITE -> 010 Generalforsamling ===
-    if any(x in filnavn_lower for x in ["saksliste", "valgkomite"]):
-        år = None
-        for part in list(undermapper) + [mappenavn, filnavn]:
-            m = re.search(r"20\d{2}", part)
-            if m:
-                år = m.group()
-                break
-
-        if år:
-            return MÅL / "010 Generalforsamling" / f"{år} Generalforsamling" / normaliser_filnavn(filnavn), "GF-vedlegg"
-
-    # === EKSTRAORDINÆR GF -> 010 Generalforsamling/Ekstraordinære ===
-    if "ekstraordinær" in mappenavn.lower() or "ex.ord" in filnavn_lower:
-        # Finn årstall for mappe
-        år = None
-        for part in list(undermapper) + [mappenavn, filnavn]:
-            m = re.search(r"20\d{2}", part)
-            if m:
-                år = m.group()
-                break
-        if år:
-            return MÅL / "010 Generalforsamling" / f"{år} Generalforsamling" / "Ekstraordinær" / normaliser_filnavn(filnavn), "Ekstraordinær GF"
-
-    # === STATSBYGG REFERAT -> 310 Statsbygg ===
-    if "statsbygg" in filnavn_lower and ("referat" in filnavn_lower or "rapport" in filnavn_lower):
-        return MÅL / "310 Statsbygg" / normaliser_filnavn(filnavn), "Statsbygg"
-
-    # === VEDTEKTER -> 000 Vedtekter og styringsdokumenter ===
-    if "vedtekter" in filnavn_lower:
-        # Eldre versjoner (med dato eller "revidert", "gammel") -> X00 Historikk
-        har_dato = bool(re.search(r"20\d{2}", filnavn))
-        er_historisk = any(x in filnavn_lower for x in ["revidert", "gammel", "utgått", "tidligere"])
-
-        if har_dato or er_historisk:
-            return MÅL / "000 Vedtekter og styringsdokumenter" / "X00 Historikk" / normaliser_filnavn(filnavn), "Vedtekter (historikk)"
-        else:
-            return MÅL / "000 Vedtekter og styringsdokumenter" / normaliser_filnavn(filnavn), "Vedtekter"
 
-    # === REGNSKAP/BUDSJETT -> 010 Generalforsamling (regnskap for år X -> GF X+1) ===
-    if any(x in filnavn_lower for x in ["regnskap", "budsjett"]) and kilde.suffix.lower() in [".xlsx", ".xls", ".pdf", ".docx", ".doc"]:
-        år = None
-        m = re.search(r"20\d{2}", filnavn)
-        if m:
-            år = m.group()
-        if år:
-            gf_år = str(int(år) + 1)  # Regnskap 2023 -> GF 2024
-            return MÅL / "010 Generalforsamling" / f"{gf_år} Generalforsamling" / normaliser_filnavn(filnavn), "Regnskap/Budsjett"
-
-    # === VÅRBREV -> 024 Vårbrev og medlemskommunikasjon ===
-    if "vårbrev" in filnavn_lower:
-        år = None
-        m = re.search(r"20\d{2}", filnavn)
-        if m:
-            år = m.group()
-        if år:
-            return MÅL / "024 Vårbrev og medlemskommunikasjon" / normaliser_filnavn(filnavn), "Vårbrev"
+    def __init__(self, nøkkelord: set[str]):
+        alternativer = "|".join(re.escape(ord_) for ord_ in sorted(nøkkelord, key=len, reverse=True))
+        self.mønster = re.compile(alternativer)
+        self.starter_med = {ord_: [p for p in nøkkelord if ord_.startswith(p)] for ord_ in nøkkelord}
+
+    def finn(self, tekst: str) -> list[tuple[str, int]]:
+        """Gir (nøkkelord, startposisjon) for alle forekomster i teksten."""
+        treff = []
+        m = self.mønster.search(tekst)
+        while m:
+            start = m.start()
+            treff.extend((ord_, start) for ord_ in self.starter_med[m.group()])
+            m = self.mønster.search(tekst, start + 1)
+        return treff
+
+    @functools.lru_cache(maxsize=4096)
+    def alle(self, tekst: str) -> frozenset[str]:
+        """Mengden av nøkkelord som forekommer i teksten."""
+        return frozenset(ord_ for ord_, _ in self.finn(tekst))
+
+
+_ÅR = re.compile(r"20\d{2}")
+
+MÅNEDER = ["januar", "februar", "mars", "april", "mai", "juni",
+           "juli", "august", "september", "oktober", "november", "desember"]
+
+
+class _Fil:
+    """Alt regelverket trenger å vite om én kildefil, beregnet én gang."""
+
+    __slots__ = ("kilde", "relativ_sti", "filnavn", "mappenavn", "filnavn_lower", "mappenavn_lower",
+                 "i_fil", "prefikser", "i_mappe", "år_fil", "_undermapper", "_år_sti", "_nytt_navn")
+
+    def __init__(self, kilde: Path, relativ_sti: Path):
+        self.kilde = kilde
+        self.relativ_sti = relativ_sti
+        # Normaliser Unicode (macOS bruker ofte NFD, Python-strenger er NFC)
+        self.filnavn = unicodedata.normalize("NFC", kilde.name)
+        self.mappenavn = unicodedata.normalize("NFC", relativ_sti.parts[0]) if relativ_sti.parts else ""
+        self.filnavn_lower = self.filnavn.lower()
+        self.mappenavn_lower = self.mappenavn.lower()
+
+        treff = _SØK.finn(self.filnavn_lower)
+        self.i_fil = {ord_ for ord_, _ in treff}
+        self.prefikser = {ord_ for ord_, start in treff if start == 0}
+        # Toppmappene er få og går igjen for hver fil, så de slås opp i en cache
+        self.i_mappe = _SØK.alle(self.mappenavn_lower)
+
+        # Første årstall i filnavnet
+        m = _ÅR.search(self.filnavn)
+        self.år_fil = m.group() if m else None
+
+        # Resten beregnes først når en regel trenger det
+        self._undermapper = None
+        self._år_sti = False
+        self._nytt_navn = None
+
+    @property
+    def undermapper(self) -> tuple[str, ...]:
+        if self._undermapper is None:
+            parts = self.relativ_sti.parts
+            self._undermapper = tuple(unicodedata.normalize("NFC", p) for p in parts[1:-1])
+        return self._undermapper
+
+    @property
+    def i_sti(self) -> frozenset[str]:
+        return _SØK.alle(str(self.relativ_sti).lower())
+
+    @property
+    def år_sti(self) -> str | None:
+        """Første årstall i undermappene, toppmappen eller filnavnet, i den rekkefølgen."""
+        if self._år_sti is False:
+            self._år_sti = self.år_fil
+            for part in self.undermapper + (self.mappenavn,):
+                m = _ÅR.search(part)
+                if m:
+                    self._år_sti = m.group()
+                    break
+        return self._år_sti
+
+    @property
+    def nytt_navn(self) -> str:
+        if self._nytt_navn is None:
+            self._nytt_navn = normaliser_filnavn(self.filnavn)
+        return self._nytt_navn
+
+    @property
+    def understi(self) -> Path:
+        return Path(*self.relativ_sti.parts[1:-1]) if len(self.relativ_sti.parts) > 1 else Path()
+
+
+# === MÅLBYGGERE ===
+# Hver bygger tar en _Fil og returnerer (målsti, kategori), eller None for å gå videre til neste regel.
+
+def _flat(mappe: str, kategori: str, krever_år: bool = False):
+    def bygg(f: _Fil):
+        if krever_år and not f.år_fil:
+            return None
+        return MÅL / mappe / f.nytt_navn, kategori
+    return bygg
+
+
+def _med_understi(mappe: str, kategori: str):
+    """Behold undermapper fra kilden."""
+    def bygg(f: _Fil):
+        return MÅL / mappe / f.understi / f.nytt_navn, kategori
+    return bygg
+
+
+def _generalforsamling(kategori: str, år_fra: str = "sti", etterskudd: bool = False, undermappe: str | None = None):
+    """
+    Mappe for generalforsamlingen i årstallet fra stien eller filnavnet.
+    Med etterskudd hører dokumentet til neste års GF (årsberetning og regnskap for år X -> GF X+1).
+    """
+    def bygg(f: _Fil):
+        år = f.år_sti if år_fra == "sti" else f.år_fil
+        if not år:
+            return None
+        if etterskudd:
+            år = str(int(år) + 1)
+        mappe = MÅL / "010 Generalforsamling" / f"{år} Generalforsamling"
+        if undermappe:
+            mappe = mappe / undermappe
+        return mappe / f.nytt_navn, kategori
+    return bygg
+
+
+def _styremøte(f: _Fil):
+    dato = ekstraher_dato(f.filnavn)
+    if not dato:
+        # Fallback hvis ingen dato funnet
+        return MÅL / "021 Styremøter" / "_usortert" / f.nytt_navn, "Styrereferat"
 
-    # === AVTALER -> 070 Avtaler og instruks ===
-    if filnavn_lower.startswith("avtale ") or filnavn_lower.startswith("kontrakt "):
-        return MÅL / "070 Avtaler og instruks" / normaliser_filnavn(filnavn), "Avtaler"
+    # Mappe: 2025-11-04 Styremøte 4. november 2025
+    år, mnd, dag = dato.split("-")
+    dato_lesbar = f"{int(dag)}. {MÅNEDER[int(mnd)-1]} {år}"
+    return MÅL / "021 Styremøter" / f"{dato} Styremøte {dato_lesbar}" / f.nytt_navn, "Styrereferat"
 
-    # === INSTRUKSER -> 070 Avtaler og instruks ===
-    if filnavn_lower.startswith("instruks "):
-        return MÅL / "070 Avtaler og instruks" / normaliser_filnavn(filnavn), "Instrukser"
 
-    # === TOMTEINNLØSNING -> 500 2020-2024 Tomteinnløsning (behold mappestruktur) ===
-    if mappenavn == "Tomteinnløsning":
-        # Behold undermapper fra kilden
-        understi = Path(*relativ_sti.parts[1:-1]) if len(relativ_sti.parts) > 1 else Path()
-        return MÅL / "500 2020-2024 Tomteinnløsning" / understi / normaliser_filnavn(filnavn), "Tomteinnløsning"
+def _fellesstyret(f: _Fil):
+    # Behold undermappe-struktur hvis relevant
+    if "fellesstyret" in f.i_mappe and f.undermapper:
+        return MÅL / "090 Fellesstyret" / f.undermapper[0] / f.nytt_navn, "Fellesstyret"
+    return MÅL / "090 Fellesstyret" / f.nytt_navn, "Fellesstyret"
 
-    # === ULOVLIGHETSOPPFØLGING PBE -> 500 2020-2025 Ulovlighetsoppfølging brygger (behold mappestruktur) ===
-    if "ulovlighetsoppfølging" in mappenavn.lower():
-        understi = Path(*relativ_sti.parts[1:-1]) if len(relativ_sti.parts) > 1 else Path()
-        return MÅL / "500 2020-2025 Ulovlighetsoppfølging brygger" / understi / normaliser_filnavn(filnavn), "Ulovlighetsoppfølging"
 
-    # Vann og kloakk / Strømnettet: Ikke flyttes automatisk - håndteres manuelt
+def _vedtekter(f: _Fil):
+    # Eldre versjoner (med dato eller "revidert", "gammel") -> X00 Historikk
+    if f.år_fil or f.i_fil & {"revidert", "gammel", "utgått", "tidligere"}:
+        return MÅL / "000 Vedtekter og styringsdokumenter" / "X00 Historikk" / f.nytt_navn, "Vedtekter (historikk)"
+    return MÅL / "000 Vedtekter og styringsdokumenter" / f.nytt_navn, "Vedtekter"
 
-    # Bål søknad: Ikke flyttes automatisk - håndteres manuelt
 
-    # === RENOVASJON -> 230 Renovasjon ===
-    if mappenavn == "Renovasjon":
-        return MÅL / "230 Renovasjon" / normaliser_filnavn(filnavn), "Renovasjon"
+def _skjøtsel(f: _Fil):
+    if f.i_fil & {"regler", "instruks", "flytdiagram", "sjekkliste"}:
+        return MÅL / "070 Avtaler og instruks" / f.nytt_navn, "Skjøtsel (regler)"
+    return MÅL / "250 Skjøtsel og miljø" / f.nytt_navn, "Skjøtsel"
 
-    # === SKJØTSEL/DUGNAD -> 070 Avtaler og instruks (regler) eller 250 Skjøtsel ===
-    if "skjøtsel" in mappenavn.lower():
-        if any(x in filnavn_lower for x in ["regler", "instruks", "flytdiagram", "sjekkliste"]):
-            return MÅL / "070 Avtaler og instruks" / normaliser_filnavn(filnavn), "Skjøtsel (regler)"
-        else:
-            return MÅL / "250 Skjøtsel og miljø" / normaliser_filnavn(filnavn), "Skjøtsel"
 
-    # === ANBUD VAKTMESTERHYTTA -> 500 2016 Renovering vaktmesterhytta (behold mappestruktur) ===
-    if "anbud" in mappenavn.lower() and "vaktmester" in str(relativ_sti).lower():
-        understi = Path(*relativ_sti.parts[1:-1]) if len(relativ_sti.parts) > 1 else Path()
-        return MÅL / "500 2016 Renovering vaktmesterhytta" / understi / normaliser_filnavn(filnavn), "Vaktmesterhytta"
+@dataclass(frozen=True)
+class Regel:
+    """
+    Én sorteringsregel. Regelen vurderes når filen treffer minst én av utløserne
+    (nøkkelord i filnavn eller toppmappe, prefiks i filnavnet, eller toppmappen med nøyaktig navn),
+    og brukes hvis alle tilleggskravene også holder og målbyggeren gir et svar.
+    Nøkkelord er med små bokstaver.
+    """
+    bygg: Callable[[_Fil], tuple[Path, str] | None]
+    fil: tuple[str, ...] = ()
+    mappe: tuple[str, ...] = ()
+    prefiks: tuple[str, ...] = ()
+    mappe_lik: str | None = None
+    også_fil: tuple[str, ...] = ()
+    også_sti: tuple[str, ...] = ()
+    endelser: tuple[str, ...] = ()
+
+    def gjelder(self, f: _Fil) -> bool:
+        if self.også_fil and not f.i_fil.intersection(self.også_fil):
+            return False
+        if self.også_sti and not f.i_sti.intersection(self.også_sti):
+            return False
+        if self.endelser and f.kilde.suffix.lower() not in self.endelser:
+            return False
+        return True
+
+
+# Første regel som gir et svar bestemmer målet, så rekkefølgen betyr noe
+REGLER = [
+    # MVA/Frivillighetsregisteret -> 500-prosjekt (tidlig for å fange alle filer)
+    Regel(_med_understi("502 2024 MVA-refusjon", "MVA-refusjon"), mappe=("mva", "frivillighetsregister")),
+    # Styremøter -> 021 Styremøter (flatt med møtemapper)
+    Regel(_styremøte, fil=("styrereferat", "referat styremøte")),
+    Regel(_generalforsamling("Generalforsamling"), fil=("generalforsamling", "protokoll gf", "protokoll fra gf")),
+    Regel(_generalforsamling("Medlemsmøte"), fil=("medlemsmøte",)),
+    Regel(_generalforsamling("Innkalling GF"), fil=("innkalling",), også_fil=("general",)),
+    Regel(_generalforsamling("Årsberetning", år_fra="fil", etterskudd=True), fil=("årsberetning",)),
+    Regel(_fellesstyret, fil=("fellesstyret", "fellestyret"), mappe=("fellesstyret",)),
+    Regel(_generalforsamling("GF-vedlegg"), fil=("saksliste", "valgkomite")),
+    Regel(_generalforsamling("Ekstraordinær GF", undermappe="Ekstraordinær"), fil=("ex.ord",), mappe=("ekstraordinær",)),
+    Regel(_flat("310 Statsbygg", "Statsbygg"), fil=("statsbygg",), også_fil=("referat", "rapport")),
+    Regel(_vedtekter, fil=("vedtekter",)),
+    Regel(
+        _generalforsamling("Regnskap/Budsjett", år_fra="fil", etterskudd=True),
+        fil=("regnskap", "budsjett"),
+        endelser=(".xlsx", ".xls", ".pdf", ".docx", ".doc"),
+    ),
+    Regel(_flat("024 Vårbrev og medlemskommunikasjon", "Vårbrev", krever_år=True), fil=("vårbrev",)),
+    Regel(_flat("070 Avtaler og instruks", "Avtaler"), prefiks=("avtale ", "kontrakt ")),
+    Regel(_flat("070 Avtaler og instruks", "Instrukser"), prefiks=("instruks ",)),
+    Regel(_med_understi("500 2020-2024 Tomteinnløsning", "Tomteinnløsning"), mappe_lik="Tomteinnløsning"),
+    Regel(
+        _med_understi("500 2020-2025 Ulovlighetsoppfølging brygger", "Ulovlighetsoppfølging"),
+        mappe=("ulovlighetsoppfølging",),
+    ),
+    # Vann og kloakk / Strømnettet / Bål søknad: Ikke flyttes automatisk - håndteres manuelt
+    Regel(_flat("230 Renovasjon", "Renovasjon"), mappe_lik="Renovasjon"),
+    Regel(_skjøtsel, mappe=("skjøtsel",)),
+    Regel(
+        _med_understi("500 2016 Renovering vaktmesterhytta", "Vaktmesterhytta"),
+        mappe=("anbud",),
+        også_sti=("vaktmester",),
+    ),
+]
+
+# Oppslag fra utløser til regelnumre, så en fil bare vurderes mot regler den kan treffe
+_UTLØSERE: dict[tuple[str, str], list[int]] = {}
+for _nr, _regel in enumerate(REGLER):
+    for _felt, _ordene in (("fil", _regel.fil), ("mappe", _regel.mappe), ("prefiks", _regel.prefiks)):
+        for _ord in _ordene:
+            _UTLØSERE.setdefault((_felt, _ord), []).append(_nr)
+    if _regel.mappe_lik:
+        _UTLØSERE.setdefault(("mappe_lik", _regel.mappe_lik), []).append(_nr)
+
+_SØK = _Nøkkelordsøk(
+    {ord_ for felt, ord_ in _UTLØSERE if felt != "mappe_lik"}
+    | {ord_ for regel in REGLER for ord_ in regel.også_fil + regel.også_sti}
+    | {"revidert", "gammel", "utgått", "tidligere", "regler", "instruks", "flytdiagram", "sjekkliste"}
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _mappekandidater(mappenavn: str, i_mappe: frozenset[str]) -> frozenset[int]:
+    """Regler som utløses av toppmappen alene; samme for alle filer i mappen."""
+    kandidater = set(_UTLØSERE.get(("mappe_lik", mappenavn), ()))
+    for ord_ in i_mappe:
+        kandidater.update(_UTLØSERE.get(("mappe", ord_), ()))
+    return frozenset(kandidater)
+
+
+def bestem_målmappe(kilde: Path, relativ_sti: Path) -> tuple[Path, str] | None:
+    """
+    Bestemmer målmappe basert på kildefil.
+    Returnerer (målsti, kategori) eller None hvis filen skal hoppes over.
+    """
+    f = _Fil(kilde, relativ_sti)
+
+    kandidater = set(_mappekandidater(f.mappenavn, f.i_mappe))
+    for ord_ in f.i_fil:
+        kandidater.update(_UTLØSERE.get(("fil", ord_), ()))
+    for ord_ in f.prefikser:
+        kandidater.update(_UTLØSERE.get(("prefiks", ord_), ()))
+
+    for nr in sorted(kandidater):
+        regel = REGLER[nr]
+        if regel.gjelder(f):
+            resultat = regel.bygg(f)
+            if resultat:
+                return resultat
 
     return None  # Filen sorteres ikke (ennå)
 
 
-def samle_filer(mappe: Path) -> list[Path]:
-    """Samler alle filer rekursivt fra en mappe."""
+def _les_mappe(mappe: str) -> tuple[list[str], list[str]]:
+    """Leser én mappe med os.scandir og returnerer (filer, undermapper), uten ignorerte navn."""
     filer = []
-    for fil in mappe.rglob("*"):
-        if fil.is_file() and fil.name not in IGNORER and not fil.name.startswith("~$"):
-            filer.append(fil)
-    return filer
+    undermapper = []
+    PROFIL.tell("scandir-kall")
+    with os.scandir(mappe) as oppføringer:
+        for oppføring in oppføringer:
+            if oppføring.name in IGNORER or oppføring.name.startswith("~$"):
+                continue
+            if oppføring.is_dir(follow_symlinks=False):
+                undermapper.append(oppføring.path)
+            elif oppføring.is_file():
+                filer.append(oppføring.path)
+    return filer, undermapper
+
+
+def samle_filer(mappe: Path) -> Iterator[Path]:
+    """
+    Finner alle filer rekursivt fra en mappe, og gir dem videre etter hvert som mappene leses.
+    os.scandir gir filtypen fra katalogoppføringen, så det trengs ingen ekstra stat per fil,
+    og ignorerte navn hoppes over før noe under dem leses.
+    Rekkefølgen er den samme som Path.rglob: hver mappe for seg, dybde først.
+    """
+    stakk = [str(mappe)]
+    while stakk:
+        filer, undermapper = _les_mappe(stakk.pop())
+        stakk.extend(reversed(undermapper))
+        for fil in filer:
+            yield Path(fil)
 
 
-def planlegg_flyttinger(mapper: list[str]) -> list[Flytting]:
-    """Planlegger alle flyttinger fra de angitte mappene."""
-    flyttinger = []
+# Antall deltrær som gjennomgås samtidig ved planlegging
+PLAN_TRÅDER = 8
 
-    for mappenavn in mapper:
-        kildemappe = KILDE / mappenavn
-        if not kildemappe.exists():
-            print(f"⚠️  Mappe finnes ikke: {kildemappe}")
-            continue
 
-        for fil in samle_filer(kildemappe):
+def _del_opp(kildemappe: Path) -> list[list[Path] | Path]:
+    """
+    Deler en kildemappe i arbeidsenheter: filene på toppnivå, og hver undermappe for seg.
+    Enhetene i rekkefølge gir samme filrekkefølge som samle_filer(kildemappe).
+    """
+    filer, undermapper = _les_mappe(str(kildemappe))
+    return [[Path(fil) for fil in filer]] + [Path(undermappe) for undermappe in undermapper]
+
+
+def _planlegg_enhet(enhet: list[Path] | Path) -> list[Flytting]:
+    with PROFIL.fase("skann"):
+        filer = list(samle_filer(enhet)) if isinstance(enhet, Path) else enhet
+    flyttinger = []
+
+    with PROFIL.fase("klassifiser"):
+        for fil in filer:
             relativ = fil.relative_to(KILDE)
             resultat = bestem_målmappe(fil, relativ)
 
@@ -410,16 +1138,61 @@ def planlegg_flyttinger(mapper: list[str]) -> list[Flytting]:
                 målsti, kategori = resultat
                 flyttinger.append(Flytting(kilde=fil, mål=målsti, kategori=kategori))
 
+    PROFIL.tell("filer klassifisert", len(filer))
     return flyttinger
 
 
+def planlegg_flyttinger(mapper: list[str]) -> list[Flytting]:
+    """
+    Planlegger alle flyttinger fra de angitte mappene.
+    Mappene og deltrærne under dem gjennomgås parallelt, men resultatet slås sammen
+    i fast rekkefølge, så utskrift og CSV blir de samme fra kjøring til kjøring.
+    """
+    kildemapper = []
+    for mappenavn in mapper:
+        kildemappe = KILDE / mappenavn
+        if not kildemappe.exists():
+            print(f"⚠️  Mappe finnes ikke: {kildemappe}")
+            continue
+        kildemapper.append(kildemappe)
+
+    with ThreadPoolExecutor(max_workers=PLAN_TRÅDER) as pool:
+        enheter = [enhet for deler in pool.map(_del_opp, kildemapper) for enhet in deler]
+        return [f for resultat in pool.map(_planlegg_enhet, enheter) for f in resultat]
+
+
+def planlegg_fortløpende(mapper: list[str]) -> Iterator[Flytting]:
+    """
+    Som planlegg_flyttinger, men gir flyttingene videre så snart et deltre er gjennomgått,
+    i samme rekkefølge. Høyst PLAN_TRÅDER deltrær leses foran det som gis videre.
+    """
+    with ThreadPoolExecutor(max_workers=PLAN_TRÅDER) as pool:
+        underveis: deque = deque()
+        try:
+            for mappenavn in mapper:
+                kildemappe = KILDE / mappenavn
+                if not kildemappe.exists():
+                    print(f"⚠️  Mappe finnes ikke: {kildemappe}")
+                    continue
+                for enhet in _del_opp(kildemappe):
+                    underveis.append(pool.submit(_planlegg_enhet, enhet))
+                    if len(underveis) > PLAN_TRÅDER:
+                        yield from underveis.popleft().result()
+            while underveis:
+                yield from underveis.popleft().result()
+        except BaseException:
+            # Også GeneratorExit når den som leser gir opp; ikke les deltrærne som venter
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
 def eksporter_til_csv(flyttinger: list[Flytting], csv_fil: Path) -> None:
     """Eksporterer flyttingene til en CSV-fil."""
     with open(csv_fil, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(["Kategori", "Kilde", "Mål", "Kildefil", "Målfil"])
 
-        for fl in sorted(flyttinger, key=lambda x: (x.kategori, x.mål)):
+        for fl in sorted(flyttinger, key=lambda x: (x.kategori, x.mål_deler)):
             kilde_relativ = fl.kilde.relative_to(KILDE)
             mål_relativ = fl.mål.relative_to(MÅL)
             writer.writerow([
@@ -433,11 +1206,515 @@ def eksporter_til_csv(flyttinger: list[Flytting], csv_fil: Path) -> None:
     print(f"✅ Eksportert {len(flyttinger)} filer til {csv_fil}")
 
 
-def utfør_flyttinger(flyttinger: list[Flytting], dry_run: bool = True) -> None:
-    """Utfører eller simulerer flyttingene."""
+# Antall flyttinger som kjøres samtidig; hver mkdir/exists/move er en rundtur til Drive-mounten
+FLYTT_TRÅDER = 8
+# Antall målgrupper som startes foran det som er skrevet ut; resten venter til det er plass
+FLYTT_VINDU = FLYTT_TRÅDER * 4
+
+
+class LokalBackend:
+    """Flytter filene via den lokale Drive-mounten. Hver målmappe opprettes bare én gang per kjøring."""
+
+    def __init__(self):
+        self.kjente_mapper: set[Path] = set()
+        self.lås = threading.Lock()
+
+    def forbered(self, mapper: Iterable[Path]) -> None:
+        """Mappene opprettes etter hvert som de trengs."""
+
+    def opprett_mappe(self, mappe: Path) -> None:
+        if mappe in self.kjente_mapper:
+            return
+        with self.lås:
+            if mappe not in self.kjente_mapper:
+                PROFIL.tell("mkdir-kall")
+                mappe.mkdir(parents=True, exist_ok=True)
+                self.kjente_mapper.update((mappe, *mappe.parents))
+
+    def finnes(self, sti: Path) -> bool:
+        PROFIL.tell("stat-kall")
+        return sti.exists()
+
+    def flytt(self, kilde: Path, mål: Path) -> None:
+        shutil.move(kilde, mål)
+
+    def endrede(self, forventet: dict[Path, tuple[int, int] | None]) -> list[Path]:
+        """Filer som mangler eller har fått ny størrelse eller mtime."""
+        nå = _for_alle(_stat, forventet)
+        return [sti for sti, stat in forventet.items() if nå[sti] != stat]
+
+
+class DriveBackend:
+    """
+    Flytter filene direkte i den delte disken med Drive API, uten Drive-mounten, så migreringen kan
+    kjøres hvor som helst med service-kontoen fra read_sheet. En flytting er bare files().update med
+    addParents/removeParents, så ingen filinnhold kopieres; manglende mapper opprettes i batch-kall.
+    Stier tolkes relativt til MÅL, som svarer til roten av den delte disken (GOOGLE_SHARED_DRIVE_ID).
+    Med GOOGLE_DRIVE_API_ENDPOINT satt brukes en lokal testserver uten innlogging.
+    """
+
+    SCOPES = ["https://www.googleapis.com/auth/drive"]
+    # Høyst så mange id-er per files().generateIds
+    ID_PULJE = 1000
+    # Egen token-cache, så den ikke bytter plass med lesetokenet til read_sheet
+    TOKEN_FIL = Path(__file__).parent / ".cache" / "token-drive.json"
+
+    def __init__(self):
+        import read_sheet
+
+        endepunkt = os.getenv("GOOGLE_DRIVE_API_ENDPOINT")
+        if endepunkt:
+            import httplib2
+            self.http_fabrikk = lambda: httplib2.Http(timeout=60)
+        else:
+            credentials = read_sheet.get_credentials(scopes=self.SCOPES)
+            self.http_fabrikk = lambda: read_sheet.authorized_http(credentials, self.TOKEN_FIL)
+
+        # httplib2 er ikke trådsikker; hver flyttetråd får sin egen sesjon
+        self.lokal = threading.local()
+        self.tjeneste = read_sheet.build_service("drive", "v3", api_endpoint=endepunkt, http=self._http())
+        self.indeks = read_sheet.DriveIndex.from_drive(self.tjeneste)
+        self.ider: dict[Path, str | None] = {MÅL: os.getenv("GOOGLE_SHARED_DRIVE_ID")}
+        self.lås = threading.Lock()
+        # Id-er fra files().generateIds, så en mappe får samme id ved hvert forsøk på å opprette den
+        self.ledige_ider: list[str] = []
+        self.reserverte: dict[Path, str] = {}
+        self.id_lås = threading.Lock()
+
+    def _http(self):
+        if getattr(self.lokal, "http", None) is None:
+            self.lokal.http = self.http_fabrikk()
+        return self.lokal.http
+
+    def _kjør(self, lag_forespørsel, kostnad: int = 1):
+        """Kjører en forespørsel gjennom read_sheet sin SCHEDULER, med tempo og nye forsøk."""
+        from read_sheet import SCHEDULER
+
+        return SCHEDULER.run("drive", lambda _: lag_forespørsel().execute(http=self._http()), cost=kostnad)
+
+    def _id(self, sti: Path) -> str | None:
+        """Drive-id for stien, slått opp mappe for mappe fra roten, eller None hvis den ikke finnes."""
+        with self.lås:
+            if sti in self.ider:
+                return self.ider[sti]
+        forelder = self._id(sti.parent) if sti != MÅL else None
+        treff = []
+        if forelder:
+            treff = self.indeks.find(sti.name, forelder) or self.indeks.find(unicodedata.normalize("NFC", sti.name), forelder)
+        with self.lås:
+            return self.ider.setdefault(sti, treff[0]["id"] if treff else None)
+
+    def _reserver_ider(self, mapper: list[Path]) -> None:
+        """Gir hver av mappene en ubrukt id fra Drive, med høyst ID_PULJE per kall, før de opprettes."""
+        with self.id_lås:
+            nye = [mappe for mappe in mapper if mappe not in self.reserverte]
+            while len(self.ledige_ider) < len(nye):
+                antall = min(self.ID_PULJE, len(nye) - len(self.ledige_ider))
+                svar = self._kjør(lambda: self.tjeneste.files().generateIds(count=antall, space="drive", type="files"))
+                self.ledige_ider.extend(svar["ids"])
+            for mappe in nye:
+                self.reserverte[mappe] = self.ledige_ider.pop()
+
+    def _mappe(self, mappe: Path) -> dict:
+        from read_sheet import FOLDER_MIME_TYPE
+
+        return {"id": self.reserverte[mappe], "name": mappe.name, "mimeType": FOLDER_MIME_TYPE, "parents": [self._id(mappe.parent)]}
+
+    def _ny_mappe(self, mappe: Path):
+        """
+        Oppretter mappen med id-en fra _reserver_ider. Kommer et nytt forsøk etter at svaret på det første
+        gikk tapt, svarer Drive 409 i stedet for å lage en mappe til med samme navn.
+        """
+        from read_sheet import DriveIndex
+
+        return self.tjeneste.files().create(body=self._mappe(mappe), supportsAllDrives=True, fields=DriveIndex.FIELDS)
+
+    def _opprettet_før(self, mappe: Path, unntak: Exception) -> bool:
+        """True, og mappen registreres, hvis unntak er 409 fordi et tidligere forsøk allerede opprettet den."""
+        from read_sheet import _error_status
+
+        if _error_status(unntak) != 409:
+            return False
+        self._mappe_opprettet(mappe, self._mappe(mappe))
+        return True
+
+    def _mappe_opprettet(self, mappe: Path, fil: dict) -> None:
+        with self.lås:
+            self.indeks.add(fil)
+            self.ider[mappe] = fil["id"]
+
+    def forbered(self, mapper: Iterable[Path]) -> None:
+        """
+        Oppretter alle manglende mapper før flyttingen, ett nivå om gangen,
+        med inntil BATCH_SIZE mapper per batch-kall. Mapper som feiler forsøkes igjen i neste runde.
+        """
+        from read_sheet import BATCH_SIZE, SCHEDULER, _is_retryable, _is_throttled
+
+        alle = {m for mappe in mapper for m in (mappe, *mappe.parents) if m.is_relative_to(MÅL) and m != MÅL}
+        mangler = sorted(m for m in alle if not self.finnes(m))
+        self._reserver_ider(mangler)
+
+        for dybde in sorted({len(m.parts) for m in mangler}):
+            ventende = [(m, 0) for m in mangler if len(m.parts) == dybde]
+            while ventende:
+                neste, feil = [], []
+                forsøk = max(n for _, n in ventende)
+                if forsøk:
+                    time.sleep(SCHEDULER.backoff(forsøk))
+
+                for i in range(0, len(ventende), BATCH_SIZE):
+                    bit = ventende[i:i + BATCH_SIZE]
+
+                    def callback(request_id, svar, unntak, bit=bit):
+                        mappe, n = bit[int(request_id)]
+                        if unntak is None:
+                            self._mappe_opprettet(mappe, svar)
+                        elif _is_retryable(unntak) and n < SCHEDULER.max_retries:
+                            if _is_throttled(unntak):
+                                SCHEDULER.throttled()
+                            neste.append((mappe, n + 1))
+                        elif not self._opprettet_før(mappe, unntak):
+                            feil.append(unntak)
+
+                    def batch(bit=bit, callback=callback):
+                        forespørsel = self.tjeneste.new_batch_http_request(callback=callback)
+                        for nr, (mappe, _) in enumerate(bit):
+                            forespørsel.add(self._ny_mappe(mappe), request_id=str(nr))
+                        return forespørsel
+
+                    # Hvert kall i en batch teller mot kvoten
+                    self._kjør(batch, kostnad=len(bit))
+
+                if feil:
+                    raise feil[0]
+                ventende = neste
+
+    def opprett_mappe(self, mappe: Path) -> None:
+        if self.finnes(mappe):
+            return
+        self.opprett_mappe(mappe.parent)
+        self._reserver_ider([mappe])
+        try:
+            self._mappe_opprettet(mappe, self._kjør(lambda: self._ny_mappe(mappe)))
+        except Exception as e:
+            if not self._opprettet_før(mappe, e):
+                raise
+
+    def finnes(self, sti: Path) -> bool:
+        return self._id(sti) is not None
+
+    def flytt(self, kilde: Path, mål: Path) -> None:
+        fil_id = self._id(kilde)
+        if fil_id is None:
+            raise FileNotFoundError(kilde)
+        fra, til = self._id(kilde.parent), self._id(mål.parent)
+        self._kjør(lambda: self.tjeneste.files().update(
+            fileId=fil_id,
+            addParents=til if til != fra else None,
+            removeParents=fra if til != fra else None,
+            body={"name": mål.name} if mål.name != kilde.name else {},
+            supportsAllDrives=True,
+            fields="id",
+        ))
+        with self.lås:
+            self.ider[kilde] = None
+            self.ider[mål] = fil_id
+
+    def endrede(self, forventet: dict[Path, tuple[int, int] | None]) -> list[Path]:
+        """Størrelse og mtime fra mounten kan ikke sammenlignes med Drive; sjekker bare at filene finnes."""
+        return [sti for sti, stat in forventet.items() if self.finnes(sti) != (stat is not None)]
+
+
+Backend = LokalBackend | DriveBackend
+
+
+# Formatversjon for --save-plan; øk ved endringer som gjør gamle planer uleselige
+PLANVERSJON = 1
+
+
+def avgjør_duplikater(flyttinger: list[Flytting], global_dedup: bool = False) -> list[Flytting]:
+    """Markerer duplikater på samme mål, og med --global-dedup også likt innhold under andre navn."""
+    with PROFIL.fase("duplikater"):
+        flyttinger = finn_duplikater(flyttinger)
+    if global_dedup:
+        with PROFIL.fase("innholdsduplikater"):
+            finn_innholdsduplikater(flyttinger)
+    return flyttinger
+
+
+def _stat(sti: Path) -> tuple[int, int] | None:
+    try:
+        st = _stat_kall(sti)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def lagre_plan(flyttinger: list[Flytting], plan_fil: Path, mapper: list[str], global_dedup: bool) -> None:
+    """
+    Skriver den ferdige planen, med duplikatavgjørelser, som JSON-linjer.
+    Første linje er et hode; deretter én linje per flytting med stier relativt til KILDE og MÅL,
+    og størrelse og mtime for filene avgjørelsene bygger på, så --apply-plan kan se om noe er endret.
+    """
+    avhengige = [f.kilde for f in flyttinger] + [
+        f.duplikat_av for f in flyttinger if f.duplikat_av is not None and not f.duplikat_av.is_relative_to(KILDE)
+    ]
+    stat = _for_alle(_stat, avhengige)
+
+    with open(plan_fil, "w", encoding="utf-8") as fil:
+        hode = {"plan": PLANVERSJON, "mapper": mapper, "global_dedup": global_dedup, "antall": len(flyttinger)}
+        fil.write(json.dumps(hode, ensure_ascii=False) + "\n")
+        for f in flyttinger:
+            linje = {
+                "kilde": str(f.kilde.relative_to(KILDE)),
+                "mål": str(f.mål.relative_to(MÅL)),
+                "kategori": f.kategori,
+                "stat": stat[f.kilde],
+            }
+            if f.duplikat_av is not None:
+                linje["duplikat_av"] = str(_kort(f.duplikat_av))
+                linje["duplikat_i_mål"] = not f.duplikat_av.is_relative_to(KILDE)
+                linje["er_identisk"] = f.er_identisk
+                if linje["duplikat_i_mål"]:
+                    linje["duplikat_stat"] = stat[f.duplikat_av]
+            fil.write(json.dumps(linje, ensure_ascii=False) + "\n")
+
+    print(f"✅ Lagret plan med {len(flyttinger)} filer til {plan_fil}")
+
+
+def les_plan(plan_fil: Path, backend: Backend | None = None) -> tuple[list[Flytting], list[Path]]:
+    """
+    Leser en plan fra lagre_plan og sjekker at filene ikke er endret siden.
+    Returnerer (flyttinger, endrede), der endrede er filer som mangler eller har ny størrelse eller mtime.
+    """
+    flyttinger = []
+    forventet: dict[Path, tuple[int, int] | None] = {}
+
+    with open(plan_fil, encoding="utf-8") as fil:
+        hode = json.loads(fil.readline())
+        if hode.get("plan") != PLANVERSJON:
+            raise ValueError(f"{plan_fil} er ikke en plan i format {PLANVERSJON}")
+
+        for linje in map(json.loads, fil):
+            f = Flytting(kilde=KILDE / linje["kilde"], mål=MÅL / linje["mål"], kategori=linje["kategori"])
+            forventet[f.kilde] = tuple(linje["stat"]) if linje["stat"] else None
+            if "duplikat_av" in linje:
+                if linje["duplikat_i_mål"]:
+                    f.duplikat_av = MÅL / linje["duplikat_av"]
+                    forventet[f.duplikat_av] = tuple(linje["duplikat_stat"]) if linje["duplikat_stat"] else None
+                else:
+                    f.duplikat_av = KILDE / linje["duplikat_av"]
+                f.er_identisk = linje["er_identisk"]
+            flyttinger.append(f)
+
+    return flyttinger, (backend or LokalBackend()).endrede(forventet)
+
+
+class Journal:
+    """
+    Append-only logg over flyttinger, én JSON-linje per hendelse.
+    En kjøring starter med "start" og alle planlagte flyttinger, som synkes til disk før noe flyttes;
+    deretter logges hver fullførte flytting. Fullførte flyttinger synkes i puljer på JOURNAL_PULJE,
+    så etter et krasj kan de siste flyttingene mangle i journalen selv om filene er flyttet.
+    Med --pipeline planlegges flyttingene underveis, og "planlegging ferdig" logges når hele arkivet er lest;
+    en kjøring som stanset før det, videreføres av neste kjøring så --rollback tar med begge.
+    Stier lagres relativt til KILDE og MÅL.
+    """
+
+    def __init__(self, sti: Path):
+        self.sti = sti
+        self.lås = threading.Lock()
+        self.fil = None
+        self.usynket = 0
+
+    def _skriv(self, hendelse: dict) -> None:
+        if self.fil is None:
+            self.sti.parent.mkdir(parents=True, exist_ok=True)
+            self.fil = open(self.sti, "a", encoding="utf-8")
+            if self.fil.tell() and not self._slutter_med_linjeskift():
+                self.fil.write("\n")  # Avslutt en halvskrevet linje fra et krasj
+        self.fil.write(json.dumps(hendelse, ensure_ascii=False) + "\n")
+        self.usynket += 1
+        if self.usynket >= JOURNAL_PULJE:
+            self._synk()
+
+    def _slutter_med_linjeskift(self) -> bool:
+        with open(self.sti, "rb") as fil:
+            fil.seek(-1, os.SEEK_END)
+            return fil.read(1) == b"\n"
+
+    def _synk(self) -> None:
+        if self.fil is not None and self.usynket:
+            self.fil.flush()
+            os.fsync(self.fil.fileno())
+            self.usynket = 0
+
+    @staticmethod
+    def _stier(f: Flytting) -> dict:
+        return {"kilde": str(f.kilde.relative_to(KILDE)), "mål": str(f.mål.relative_to(MÅL))}
+
+    def start(self, flyttinger: list[Flytting], pipeline: bool = False) -> None:
+        """Logger en ny kjøring med flyttingene som skal gjøres, og synker før noe flyttes."""
+        with self.lås:
+            self._skriv({"hendelse": "start", "pipeline": True} if pipeline else {"hendelse": "start"})
+        self.planlegg(flyttinger)
+
+    def planlegg(self, flyttinger: list[Flytting]) -> None:
+        """Logger flere flyttinger i kjøringen som pågår, og synker før de flyttes."""
+        with self.lås:
+            for f in flyttinger:
+                self._skriv({"hendelse": "planlagt", **self._stier(f), "kategori": f.kategori})
+            self._synk()
+
+    def planlegging_ferdig(self) -> None:
+        """Logger at alle flyttingene i en --pipeline-kjøring er planlagt, og synker."""
+        with self.lås:
+            self._skriv({"hendelse": "planlegging ferdig"})
+            self._synk()
+
+    def flyttet(self, f: Flytting) -> None:
+        with self.lås:
+            self._skriv({"hendelse": "flyttet", **self._stier(f)})
+
+    def tilbakeført(self, f: Flytting) -> None:
+        with self.lås:
+            self._skriv({"hendelse": "tilbakeført", **self._stier(f)})
+
+    def lukk(self) -> None:
+        with self.lås:
+            self._synk()
+            if self.fil is not None:
+                self.fil.close()
+                self.fil = None
+
+    def les(self) -> tuple[list[Flytting], list[Flytting], bool]:
+        """
+        Leser siste kjøring fra journalen.
+        Returnerer (gjenstående, fullførte, ferdig_planlagt): planlagte flyttinger som ikke er fullført,
+        i planlagt rekkefølge, fullførte flyttinger som ikke er tilbakeført, i den rekkefølgen de ble gjort,
+        og om alle flyttingene i kjøringen er planlagt. Bare en --pipeline-kjøring som stanset mens arkivet
+        ble lest, er ikke ferdig planlagt; fullførte flyttinger fra den regnes med i kjøringen etter.
+        """
+        planlagt: dict[tuple[str, str], str] = {}
+        fullført: dict[tuple[str, str], None] = {}
+        ferdig_planlagt = True
+        if self.sti.exists():
+            with open(self.sti, encoding="utf-8") as fil:
+                for linje in fil:
+                    try:
+                        hendelse = json.loads(linje)
+                    except json.JSONDecodeError:
+                        continue  # Halvskrevet linje etter et krasj
+                    nøkkel = (hendelse.get("kilde"), hendelse.get("mål"))
+                    if hendelse["hendelse"] == "start":
+                        if ferdig_planlagt:
+                            fullført.clear()
+                        planlagt = {n: planlagt.get(n, "") for n in fullført}
+                        ferdig_planlagt = not hendelse.get("pipeline", False)
+                    elif hendelse["hendelse"] == "planlegging ferdig":
+                        ferdig_planlagt = True
+                    elif hendelse["hendelse"] == "planlagt":
+                        planlagt[nøkkel] = hendelse["kategori"]
+                    elif hendelse["hendelse"] == "flyttet":
+                        fullført[nøkkel] = None
+                    elif hendelse["hendelse"] == "tilbakeført":
+                        fullført.pop(nøkkel, None)
+
+        def flytting(nøkkel: tuple[str, str]) -> Flytting:
+            return Flytting(kilde=KILDE / nøkkel[0], mål=MÅL / nøkkel[1], kategori=planlagt.get(nøkkel, ""))
+
+        gjenstående = [flytting(n) for n in planlagt if n not in fullført]
+        return gjenstående, [flytting(n) for n in fullført], ferdig_planlagt
+
+
+def _flytt_én(f: Flytting, journal: Journal | None, backend: Backend) -> bool:
+    """Flytter én fil og logger det i journalen; False hvis målet fantes fra før."""
+    backend.opprett_mappe(f.mål.parent)
+    if backend.finnes(f.mål):
+        # Uten kilde ble filen flyttet av en kjøring som krasjet før flyttingen ble logget
+        if journal is None or backend.finnes(f.kilde):
+            PROFIL.tell("fantes allerede")
+            return False
+    else:
+        start = time.perf_counter()
+        backend.flytt(f.kilde, f.mål)
+        PROFIL.mål("flytt", start)
+    if journal is not None:
+        journal.flyttet(f)
+    PROFIL.tell("flyttet")
+    return True
+
+
+def _flytt_samtidig(
+    flyttinger: list[Flytting],
+    journal: Journal | None = None,
+    backend: Backend | None = None,
+) -> Iterator[bool]:
+    """
+    Flytter filene i en begrenset trådpool og gir for hver fil, i samme rekkefølge,
+    True hvis den ble flyttet og False hvis målet fantes fra før.
+    Filer med samme mål flyttes etter hverandre i én oppgave, så bare den første kommer fram.
+    Med journal logges hver fullførte flytting.
+    Bare FLYTT_VINDU grupper er startet foran det som er gitt videre, og ved feil eller avbrudd
+    startes ingen flere, så kjøringen stopper etter flyttingene som allerede er i gang.
+    """
+    backend = backend or LokalBackend()
+    backend.forbered({f.mål.parent for f in flyttinger})
+
+    grupper: dict[tuple[str, ...], list[Flytting]] = {}
+    for f in flyttinger:
+        grupper.setdefault(f.mål_deler, []).append(f)
+
+    def flytt_gruppe(gruppe: list[Flytting]) -> list[bool]:
+        return [_flytt_én(f, journal, backend) for f in gruppe]
+
+    # Gruppene startes i rekkefølgen den første filen deres kommer i
+    ikke_startet = iter(grupper.items())
+    oppgaver: dict[tuple[str, ...], Future] = {}
+    neste = Counter()
+
+    with ThreadPoolExecutor(max_workers=FLYTT_TRÅDER) as pool:
+        try:
+            for f in flyttinger:
+                mål = f.mål_deler
+                while mål not in oppgaver or len(oppgaver) < FLYTT_VINDU:
+                    startet, gruppe = next(ikke_startet, (None, None))
+                    if gruppe is None:
+                        break
+                    oppgaver[startet] = pool.submit(flytt_gruppe, gruppe)
+                yield oppgaver[mål].result()[neste[mål]]
+                neste[mål] += 1
+                if neste[mål] == len(grupper[mål]):
+                    del oppgaver[mål]
+        except BaseException:
+            # Også GeneratorExit når den som leser gir opp; vent bare på flyttingene som er i gang
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
+def _omdøpt(f: Flytting) -> Path:
+    """Ulik fil med samme navn - bruk kildemappen som suffiks for å skille."""
+    return f.mål.parent / f"{f.mål.stem} ({f.kilde.parent.name}){f.mål.suffix}"
+
+
+def utfør_flyttinger(
+    flyttinger: list[Flytting],
+    dry_run: bool = True,
+    global_dedup: bool = False,
+    journal: Journal | None = None,
+    avgjort: bool = False,
+    backend: Backend | None = None,
+) -> None:
+    """
+    Utfører eller simulerer flyttingene.
+    Duplikater avgjøres først i fast rekkefølge; selve flyttingene går samtidig,
+    men utskriften kommer i samme rekkefølge som før.
+    Med avgjort er duplikatene allerede avgjort, f.eks. i en lagret plan.
+    """
 
     # Sjekk for duplikater
-    flyttinger = finn_duplikater(flyttinger)
+    if not avgjort:
+        flyttinger = avgjør_duplikater(flyttinger, global_dedup)
 
     # Grupper etter kategori for oversiktlig output
     kategorier: dict[str, list[Flytting]] = {}
@@ -449,53 +1726,79 @@ def utfør_flyttinger(flyttinger: list[Flytting], dry_run: bool = True) -> None:
     duplikater_hoppet = 0
     duplikater_ulike = 0
 
-    print(f"\n{'='*60}")
-    print(f"{'DRY RUN - Ingen filer flyttes' if dry_run else 'UTFØRER FLYTTING'}")
-    print(f"{'='*60}\n")
-
+    # Bestem hva som skjer med hver fil, og gi ulike duplikater nytt navn, før noe flyttes
+    oversikt: list[tuple[str, list[tuple[Flytting, Path, Path]]]] = []
+    å_flytte = []
     for kategori, filer in sorted(kategorier.items()):
-        print(f"\n## {kategori} ({len(filer)} filer)\n")
-
-        for f in sorted(filer, key=lambda x: x.mål):
+        rader = []
+        for f in sorted(filer, key=lambda x: x.mål_deler):
             kilde_kort = f.kilde.relative_to(KILDE)
             mål_kort = f.mål.relative_to(MÅL)
 
-            # Håndter duplikater
-            if f.duplikat_av is not None:
-                if f.er_identisk:
-                    print(f"  ⏭️  DUPLIKAT (identisk): {kilde_kort}")
-                    print(f"     = {f.duplikat_av.relative_to(KILDE)}\n")
-                    duplikater_hoppet += 1
-                    continue  # Hopp over identiske duplikater
-                else:
-                    # Ulik fil med samme navn - legg til suffiks
-                    stem = f.mål.stem
-                    suffix = f.mål.suffix
-                    # Bruk kildemappen som suffiks for å skille
-                    kilde_mappe = f.kilde.parent.name
-                    ny_mål = f.mål.parent / f"{stem} ({kilde_mappe}){suffix}"
-                    print(f"  ⚠️  DUPLIKAT (ulikt innhold): {kilde_kort}")
-                    print(f"     ≠ {f.duplikat_av.relative_to(KILDE)}")
-                    print(f"     → Omdøpt til: {ny_mål.name}\n")
-                    f.mål = ny_mål
-                    duplikater_ulike += 1
+            if f.duplikat_av is not None and not f.er_identisk:
+                f.mål = _omdøpt(f)
+            if f.duplikat_av is None or not f.er_identisk:
+                å_flytte.append(f)
+            rader.append((f, kilde_kort, mål_kort))
+        oversikt.append((kategori, rader))
 
-            if dry_run:
-                if f.duplikat_av is None:  # Vanlig fil
-                    print(f"  📄 {kilde_kort}")
-                    print(f"     → {mål_kort}\n")
-            else:
-                # Opprett målmappe hvis den ikke finnes
-                f.mål.parent.mkdir(parents=True, exist_ok=True)
+    if dry_run:
+        resultater = iter(())
+    else:
+        if journal is not None:
+            journal.start(å_flytte)
+        resultater = _flytt_samtidig(å_flytte, journal, backend)
+
+    print(f"\n{'='*60}")
+    print(f"{'DRY RUN - Ingen filer flyttes' if dry_run else 'UTFØRER FLYTTING'}")
+    print(f"{'='*60}\n")
 
-                # Flytt fil (innenfor samme Drive)
-                if f.mål.exists():
-                    print(f"  ⚠️  Finnes allerede: {mål_kort}")
+    try:
+        for kategori, rader in oversikt:
+            print(f"\n## {kategori} ({len(rader)} filer)\n")
+
+            for f, kilde_kort, mål_kort in rader:
+                if f.duplikat_av is not None and f.er_identisk:
+                    duplikater_hoppet += 1
+                    flyttet = None  # Hopp over identiske duplikater
                 else:
-                    shutil.move(f.kilde, f.mål)
-                    print(f"  ✅ {kilde_kort} → {mål_kort}")
+                    if f.duplikat_av is not None:
+                        duplikater_ulike += 1
+                    flyttet = None if dry_run else next(resultater)
+                _vis_flytting(f, kilde_kort, mål_kort, flyttet)
+                if flyttet:
                     utført += 1
+    finally:
+        # Ved avbrudd startes ingen flere flyttinger
+        if not dry_run:
+            resultater.close()
+
+    _vis_oppsummering(dry_run, total, utført, duplikater_hoppet, duplikater_ulike)
+
+
+def _vis_flytting(f: Flytting, kilde_kort: Path, mål_kort: Path, flyttet: bool | None) -> None:
+    """Skriver ut én fil; flyttet er None når ingenting ble forsøkt flyttet (dry-run eller identisk duplikat)."""
+    # Håndter duplikater
+    if f.duplikat_av is not None:
+        if f.er_identisk:
+            print(f"  ⏭️  DUPLIKAT (identisk): {kilde_kort}")
+            print(f"     = {_kort(f.duplikat_av)}\n")
+            return
+        print(f"  ⚠️  DUPLIKAT (ulikt innhold): {kilde_kort}")
+        print(f"     ≠ {f.duplikat_av.relative_to(KILDE)}")
+        print(f"     → Omdøpt til: {f.mål.name}\n")
+
+    if flyttet is None:
+        if f.duplikat_av is None:  # Vanlig fil
+            print(f"  📄 {kilde_kort}")
+            print(f"     → {mål_kort}\n")
+    elif flyttet:
+        print(f"  ✅ {kilde_kort} → {mål_kort}")
+    else:
+        print(f"  ⚠️  Finnes allerede: {mål_kort}")
 
+
+def _vis_oppsummering(dry_run: bool, total: int, utført: int, duplikater_hoppet: int, duplikater_ulike: int) -> None:
     print(f"\n{'='*60}")
     if dry_run:
         faktisk_flyttes = total - duplikater_hoppet
@@ -513,7 +1816,253 @@ def utfør_flyttinger(flyttinger: list[Flytting], dry_run: bool = True) -> None:
     print(f"{'='*60}\n")
 
 
+# Maks antall filer som venter mellom trinnene i --pipeline; begrenser minnebruken
+PIPELINE_KØ = 256
+
+
+def utfør_pipeline(
+    mapper: list[str],
+    dry_run: bool = True,
+    journal: Journal | None = None,
+    backend: Backend | None = None,
+) -> None:
+    """
+    Planlegger og flytter i én gjennomgang, så flyttingene starter mens arkivet fortsatt leses.
+    Lesing, hashing og flytting går i hvert sitt trinn bundet sammen av begrensede køer,
+    så bare rundt PIPELINE_KØ filer er underveis om gangen. For å kjenne igjen senere filer til samme mål
+    huskes likevel hvert mål som er brukt, med kilden og flyttingen til filen som kom dit først,
+    så minnebruken vokser med antall ulike mål, omtrent som planen i planlegg_flyttinger.
+    Den første filen til et mål flyttes med en gang; senere filer til samme mål sammenlignes med den
+    der den nå ligger, og hoppes over eller får nytt navn som i utfør_flyttinger.
+    Utskriften kommer i arkivets rekkefølge og ikke gruppert etter kategori.
+    """
+    backend = backend or LokalBackend()
+    kø: queue.Queue = queue.Queue(maxsize=PIPELINE_KØ)
+    feil: list[BaseException] = []
+    stopp = threading.Event()
+
+    def legg_i_kø(f: Flytting | None) -> bool:
+        """Venter på plass i køen; False hvis kjøringen er stoppet i mellomtiden."""
+        while not stopp.is_set():
+            try:
+                kø.put(f, timeout=0.2)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def les() -> None:
+        try:
+            with contextlib.closing(planlegg_fortløpende(mapper)) as flyttinger:
+                for f in flyttinger:
+                    if not legg_i_kø(f):
+                        break
+        except BaseException as e:
+            feil.append(e)
+        finally:
+            legg_i_kø(None)
+
+    # Første flytting til hvert mål, og omdøpte mål, så hvert mål bare har én som flytter dit
+    lås = threading.Lock()
+    originaler: dict[Path, tuple[Future, Path]] = {}
+    omdøpte: set[Path] = set()
+    # Planleggingen er ferdig når arkivet er lest og alle duplikater har fått et mål
+    lest = False
+    uavklarte = 0
+
+    def planlegging_ferdig_hvis_klar() -> None:
+        """Kalles med lås; logger "planlegging ferdig" når ingenting gjenstår å planlegge."""
+        if lest and not uavklarte and journal is not None and not dry_run:
+            journal.planlegging_ferdig()
+
+    def flytt_original(f: Flytting) -> bool | None:
+        with lås:
+            opptatt = f.mål in omdøpte
+        if dry_run:
+            return None
+        if opptatt:
+            return False
+        return _flytt_én(f, journal, backend)
+
+    def flytt_duplikat(f: Flytting) -> bool | None:
+        nonlocal uavklarte
+        original, original_kilde = originaler[f.mål]
+        f.duplikat_av = original_kilde
+        # Originalen ligger i målet hvis den ble flyttet, ellers fortsatt i kilden
+        f.er_identisk = likt_innhold(f.kilde, f.mål if original.result() else original_kilde)
+        opptatt = False
+        if not f.er_identisk:
+            f.mål = _omdøpt(f)
+            with lås:
+                opptatt = f.mål in originaler or f.mål in omdøpte
+                omdøpte.add(f.mål)
+            if journal is not None and not dry_run and not opptatt:
+                journal.planlegg([f])
+        with lås:
+            uavklarte -= 1
+            planlegging_ferdig_hvis_klar()
+        if dry_run or f.er_identisk:
+            return None
+        if opptatt:
+            return False
+        return _flytt_én(f, journal, backend)
+
+    total = 0
+    utført = 0
+    duplikater_hoppet = 0
+    duplikater_ulike = 0
+    underveis: deque[tuple[Flytting, Path, Path, Future]] = deque()
+
+    def vis(alle: bool = False) -> None:
+        nonlocal utført, duplikater_hoppet, duplikater_ulike
+        while underveis and (alle or len(underveis) > PIPELINE_KØ or underveis[0][3].done()):
+            f, kilde_kort, mål_kort, oppgave = underveis.popleft()
+            flyttet = oppgave.result()
+            if f.duplikat_av is not None:
+                if f.er_identisk:
+                    duplikater_hoppet += 1
+                else:
+                    duplikater_ulike += 1
+            _vis_flytting(f, kilde_kort, mål_kort, flyttet)
+            if flyttet:
+                utført += 1
+
+    print(f"\n{'='*60}")
+    print(f"{'DRY RUN - Ingen filer flyttes' if dry_run else 'UTFØRER FLYTTING'} (pipeline)")
+    print(f"{'='*60}\n")
+
+    if journal is not None and not dry_run:
+        journal.start([], pipeline=True)
+    threading.Thread(target=les, daemon=True).start()
+
+    with ThreadPoolExecutor(max_workers=FLYTT_TRÅDER) as pool:
+        try:
+            ferdig = False
+            while not ferdig:
+                # Samle det som er klart, opptil en journalpulje, så de nye målene synkes samlet
+                try:
+                    pulje = [kø.get(timeout=0.2)]
+                except queue.Empty:
+                    vis()
+                    continue
+                while pulje[-1] is not None and len(pulje) < JOURNAL_PULJE:
+                    try:
+                        pulje.append(kø.get_nowait())
+                    except queue.Empty:
+                        break
+                if pulje[-1] is None:
+                    ferdig = True
+                    pulje.pop()
+
+                nye: dict[Path, Flytting] = {}
+                for f in pulje:
+                    if f.mål not in originaler:
+                        nye.setdefault(f.mål, f)
+                if journal is not None and not dry_run and nye:
+                    journal.planlegg(list(nye.values()))
+
+                for f in pulje:
+                    kilde_kort = f.kilde.relative_to(KILDE)
+                    mål_kort = f.mål.relative_to(MÅL)
+                    if nye.get(f.mål) is f:
+                        # Registreres før flyttingen kan starte, så ingen omdøpt duplikat tar samme mål
+                        with lås:
+                            oppgave = pool.submit(flytt_original, f)
+                            originaler[f.mål] = (oppgave, f.kilde)
+                    else:
+                        with lås:
+                            uavklarte += 1
+                        oppgave = pool.submit(flytt_duplikat, f)
+                    underveis.append((f, kilde_kort, mål_kort, oppgave))
+                    total += 1
+                if ferdig and not feil:
+                    with lås:
+                        lest = True
+                        planlegging_ferdig_hvis_klar()
+                vis()
+            vis(alle=True)
+        except BaseException:
+            # Feil i en flytting eller avbrudd: stopp lesingen og start ingen flere flyttinger
+            stopp.set()
+            pool.shutdown(cancel_futures=True)
+            raise
+
+    if feil:
+        raise feil[0]
+
+    _vis_oppsummering(dry_run, total, utført, duplikater_hoppet, duplikater_ulike)
+
+
+def gjenoppta_flyttinger(journal: Journal, backend: Backend | None = None) -> bool:
+    """
+    Fullfører flyttingene fra forrige kjøring ut fra journalen, uten å gå gjennom arkivet på nytt.
+    Flyttinger som er logget som fullført hoppes over uten å røre filsystemet.
+    Returnerer False uten å flytte noe hvis journalen ikke har alle flyttingene i kjøringen.
+    """
+    gjenstående, fullførte, ferdig_planlagt = journal.les()
+
+    if not ferdig_planlagt:
+        print("❌ Forrige kjøring med --pipeline stanset før hele arkivet var lest,")
+        print("   så journalen har ikke alle flyttingene. Kjør --pipeline på nytt for å fortsette;")
+        print("   --rollback tar da med flyttingene fra begge kjøringene.")
+        return False
+
+    print(f"\n{'='*60}")
+    print(f"GJENOPPTAR FLYTTING ({len(gjenstående)} gjenstår, {len(fullførte)} allerede flyttet)")
+    print(f"{'='*60}\n")
+
+    utført = 0
+    with contextlib.closing(_flytt_samtidig(gjenstående, journal, backend)) as resultater:
+        for f, flyttet in zip(gjenstående, resultater):
+            kilde_kort = f.kilde.relative_to(KILDE)
+            mål_kort = f.mål.relative_to(MÅL)
+            if flyttet:
+                print(f"  ✅ {kilde_kort} → {mål_kort}")
+                utført += 1
+            else:
+                print(f"  ⚠️  Finnes allerede: {mål_kort}")
+
+    print(f"\n{'='*60}")
+    print(f"Flyttet: {utført}/{len(gjenstående)} gjenstående filer")
+    print(f"{'='*60}\n")
+    return True
+
+
+def tilbakefør_flyttinger(journal: Journal, backend: Backend | None = None) -> None:
+    """
+    Flytter filene fra forrige kjøring tilbake, i motsatt rekkefølge av journalen.
+    Målmapper som ble opprettet blir stående.
+    """
+    _, fullførte, _ = journal.les()
+    backend = backend or LokalBackend()
+
+    print(f"\n{'='*60}")
+    print(f"TILBAKEFØRER {len(fullførte)} FLYTTINGER")
+    print(f"{'='*60}\n")
+
+    utført = 0
+    for f in reversed(fullførte):
+        kilde_kort = f.kilde.relative_to(KILDE)
+        mål_kort = f.mål.relative_to(MÅL)
+        if not backend.finnes(f.mål):
+            print(f"  ⚠️  Mangler i målet: {mål_kort}")
+        elif backend.finnes(f.kilde):
+            print(f"  ⚠️  Finnes allerede i kilden: {kilde_kort}")
+        else:
+            backend.opprett_mappe(f.kilde.parent)
+            backend.flytt(f.mål, f.kilde)
+            journal.tilbakeført(f)
+            print(f"  ↩️  {mål_kort} → {kilde_kort}")
+            utført += 1
+
+    print(f"\n{'='*60}")
+    print(f"Tilbakeført: {utført}/{len(fullførte)} filer")
+    print(f"{'='*60}\n")
+
+
 def main():
+    global PROFIL
+
     parser = argparse.ArgumentParser(
         description="Migrerer Bleikøya Vel-arkiv fra Dropbox til Google Drive"
     )
@@ -530,42 +2079,149 @@ def main():
     parser.add_argument(
         "--mapper", "-m",
         nargs="+",
-        default=[
-            # Mapper i 900 Arkiv som skal migreres
-            "Referat",
-            "Generalforsamling",
-            "Vårbrev, Årsberetning",
-            "Avtaler og instruks",
-            "Regnskap, budsjett",
-            "Vedtekter, informasjon til hytteeierne",
-            "Tomteinnløsning",
-            "Ulovlighetsoppfølging PBE",
-            "Frivillighetsregisteret MVA refusjon",
-            "Renovasjon",
-            "Skjøtsel, dugnad, trær, planter",
-            "Anbud",
-            "Fellesstyret for øyene",
-        ],
+        default=STANDARD_MAPPER,
         help="Hvilke mapper i 900 Arkiv som skal behandles"
     )
+    parser.add_argument(
+        "--no-hash-cache",
+        action="store_true",
+        help=f"Beregn alle hasher på nytt i stedet for å bruke {HASHCACHE_FIL.name}"
+    )
+    parser.add_argument(
+        "--global-dedup",
+        action="store_true",
+        help="Hopp også over filer med likt innhold under andre navn, og filer som allerede finnes i målet"
+    )
+    modus = parser.add_mutually_exclusive_group()
+    modus.add_argument(
+        "--save-plan",
+        type=Path,
+        metavar="PLAN",
+        help="Lagre den ferdige planen med duplikatavgjørelser til fil, uten å flytte noe (vises med --dry-run)"
+    )
+    modus.add_argument(
+        "--apply-plan",
+        type=Path,
+        metavar="PLAN",
+        help="Utfør en plan fra --save-plan uten å gå gjennom arkivet på nytt, hvis ingen filer er endret siden"
+    )
+    modus.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Fullfør en avbrutt migrering ut fra {JOURNAL_FIL.name}, uten å gå gjennom arkivet på nytt"
+    )
+    modus.add_argument(
+        "--rollback",
+        action="store_true",
+        help=f"Flytt filene fra forrige migrering tilbake, i motsatt rekkefølge av {JOURNAL_FIL.name}"
+    )
+    modus.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Start flyttingen mens arkivet fortsatt leses; utskriften kommer i arkivets rekkefølge"
+    )
+
+    parser.add_argument(
+        "--backend",
+        choices=["lokal", "drive"],
+        default="lokal",
+        help="Flytt via Drive-mounten (lokal) eller direkte med Drive API (drive); "
+             "drive krever --apply-plan, --resume eller --rollback"
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        metavar="JSON",
+        help="Mål tid per fase, antall stat-kall, byte hashet og ventetid per flytting, og lagre oppsummeringen som JSON"
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        metavar="JSON",
+        help="Lagre fasene og hver hashing og flytting som Chrome-trace (chrome://tracing eller ui.perfetto.dev)"
+    )
 
     args = parser.parse_args()
+    if (args.resume or args.rollback) and (args.dry_run or args.csv):
+        parser.error("--resume og --rollback kan ikke kombineres med --dry-run eller --csv")
+    if args.pipeline and (args.csv or args.global_dedup):
+        parser.error("--pipeline kan ikke kombineres med --csv eller --global-dedup, som trenger hele planen først")
+    if args.backend == "drive" and not (args.apply_plan or args.resume or args.rollback):
+        parser.error("--backend drive krever --apply-plan, --resume eller --rollback; planlegg med mounten og --save-plan")
+
+    if args.profile or args.trace:
+        PROFIL = Profil(args.profile, args.trace)
+    try:
+        return _migrer(args)
+    finally:
+        PROFIL.skriv()
+
+
+def _migrer(args: argparse.Namespace) -> int:
+    """Kjører det main() har valgt; egen funksjon så profilen skrives uansett hvordan kjøringen ender."""
+    global HASHCACHE
 
     print(f"Kilde: {KILDE}")
     print(f"Mål:   {MÅL}")
     print(f"Mapper: {', '.join(args.mapper)}")
 
-    # Verifiser at stier finnes
-    if not KILDE.exists():
-        print(f"❌ Kildemappe finnes ikke: {KILDE}")
-        return 1
+    if args.backend == "drive":
+        print("Leser den delte disken fra Drive API...")
+        backend = DriveBackend()
+    else:
+        backend = LokalBackend()
+
+        # Verifiser at stier finnes
+        if not KILDE.exists():
+            print(f"❌ Kildemappe finnes ikke: {KILDE}")
+            return 1
+
+        if not MÅL.exists():
+            print(f"❌ Målmappe finnes ikke: {MÅL}")
+            return 1
+
+    journal = Journal(JOURNAL_FIL)
+    if args.resume or args.rollback:
+        try:
+            with PROFIL.fase("utfør"):
+                if args.resume:
+                    if not gjenoppta_flyttinger(journal, backend):
+                        return 1
+                else:
+                    tilbakefør_flyttinger(journal, backend)
+        finally:
+            journal.lukk()
+        return 0
+
+    if args.apply_plan:
+        try:
+            with PROFIL.fase("les plan"):
+                flyttinger, endrede = les_plan(args.apply_plan, backend)
+        except (OSError, ValueError) as e:
+            print(f"❌ Kan ikke lese plan: {e}")
+            return 1
+        if endrede:
+            print(f"❌ {len(endrede)} filer er endret eller borte siden planen ble laget:")
+            for sti in endrede[:10]:
+                print(f"   {_kort(sti)}")
+            print("Lag en ny plan med --save-plan")
+            return 1
+    else:
+        if not args.no_hash_cache:
+            HASHCACHE = Hashcache(HASHCACHE_FIL)
 
-    if not MÅL.exists():
-        print(f"❌ Målmappe finnes ikke: {MÅL}")
-        return 1
+        if args.pipeline:
+            try:
+                with PROFIL.fase("utfør"):
+                    utfør_pipeline(args.mapper, dry_run=args.dry_run, journal=journal, backend=backend)
+            finally:
+                journal.lukk()
+            return 0
 
-    # Planlegg og utfør
-    flyttinger = planlegg_flyttinger(args.mapper)
+        # Planlegg og utfør
+        with PROFIL.fase("planlegg"):
+            flyttinger = planlegg_flyttinger(args.mapper)
 
     if not flyttinger:
         print("\n⚠️  Ingen filer å flytte")
@@ -575,9 +2231,28 @@ def main():
     if args.csv:
         eksporter_til_csv(flyttinger, args.csv)
 
+    # Lagre planen for gjennomgang; flyttes senere med --apply-plan
+    if args.save_plan:
+        flyttinger = avgjør_duplikater(flyttinger, args.global_dedup)
+        with PROFIL.fase("lagre plan"):
+            lagre_plan(flyttinger, args.save_plan, args.mapper, args.global_dedup)
+        if not args.dry_run:
+            return 0
+
     # Vis/utfør flyttinger (med mindre bare CSV er ønsket)
     if not args.csv or args.dry_run:
-        utfør_flyttinger(flyttinger, dry_run=args.dry_run)
+        try:
+            with PROFIL.fase("utfør"):
+                utfør_flyttinger(
+                    flyttinger,
+                    dry_run=args.dry_run,
+                    global_dedup=args.global_dedup,
+                    journal=journal,
+                    avgjort=bool(args.apply_plan or args.save_plan),
+                    backend=backend,
+                )
+        finally:
+            journal.lukk()
 
     return 0
 
@@ -4,6 +4,8 @@
 # dependencies = [
 #     "google-api-python-client",
 #     "google-auth",
+#     "google-auth-httplib2",
+#     "httplib2",
 #     "python-dotenv",
 # ]
 # ///
@@ -11,26 +13,48 @@
 Read Google Sheet from shared drive using service account.
 """
 
+import argparse
+import datetime
+import functools
+import gzip
 import json
 import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urljoin
 
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 
 # Load environment variables
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(env_path)
 
+# Local caches (covered by documents/.htaccess and .gitignore)
+CACHE_DIR = Path(__file__).parent / ".cache"
+DRIVE_CACHE_PATH = CACHE_DIR / "drive-tree.sqlite"
+SHEET_CACHE_DIR = CACHE_DIR / "sheets"
+TOKEN_CACHE_PATH = CACHE_DIR / "token.json"
+
+# Cached access tokens are refreshed this long before they expire
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Upper bound for cached spreadsheet snapshots; least recently read are evicted first
+SHEET_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
 SCOPES = [
     "https://www.googleapis.com/auth/drive.readonly",
     "https://www.googleapis.com/auth/spreadsheets.readonly",
 ]
 
 
-def get_credentials():
-    """Get Google API credentials from service account."""
+def get_credentials(scopes: list[str] = SCOPES):
+    """Get Google API credentials from service account, read-only unless other scopes are given."""
+    from google.oauth2 import service_account
+
     creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     if creds_path.startswith("./"):
         creds_path = Path(__file__).parent.parent / creds_path[2:]
@@ -38,93 +62,719 @@ def get_credentials():
         creds_path = Path(creds_path)
 
     return service_account.Credentials.from_service_account_file(
-        str(creds_path), scopes=SCOPES
+        str(creds_path), scopes=scopes
     )
 
 
-def find_file_in_drive(drive_service, name: str, parent_id: str = None):
-    """Find a file or folder by name in the shared drive."""
-    shared_drive_id = os.getenv("GOOGLE_SHARED_DRIVE_ID")
+def _restore_token(credentials, token_path: Path):
+    """Load a still valid access token for the same service account and scopes from disk."""
+    try:
+        cached = json.loads(token_path.read_text())
+        if cached.get("account") != credentials.service_account_email or cached.get("scopes") != list(credentials.scopes):
+            return
+        token, expiry = cached["token"], datetime.datetime.fromisoformat(cached["expiry"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        # Missing, unreadable or from an older format; a new token is fetched instead
+        return
 
-    query = f"name = '{name}'"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
+    credentials.token = token
+    credentials.expiry = expiry
+
+
+def _save_token(credentials, token_path: Path):
+    token_path.parent.mkdir(parents=True, exist_ok=True)
+    # The token grants API access; keep it readable by the owner only
+    fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({
+            "account": credentials.service_account_email,
+            "scopes": list(credentials.scopes),
+            "token": credentials.token,
+            "expiry": credentials.expiry.isoformat(),
+        }, f)
+
+
+# Serializes token refreshes, so worker threads sharing one credentials object refresh and save it once
+_TOKEN_LOCK = threading.Lock()
+
+
+def _needs_refresh(credentials) -> bool:
+    # google-auth expiry is naive UTC
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return not credentials.token or credentials.expiry is None or credentials.expiry - now < TOKEN_REFRESH_MARGIN
+
+
+def authorized_http(credentials, token_path: Path = TOKEN_CACHE_PATH):
+    """
+    A new keep-alive HTTP session authorized with credentials; httplib2 is not thread-safe, so use one per thread.
+    The access token is reused across runs from token_path and refreshed ahead of expiry.
+    When several threads ask at once, the first refreshes and saves it and the others reuse it.
+    """
+    import google_auth_httplib2
+    import httplib2
+
+    http = httplib2.Http(timeout=60)
+
+    with _TOKEN_LOCK:
+        if _needs_refresh(credentials):
+            _restore_token(credentials, token_path)
+        if _needs_refresh(credentials):
+            credentials.refresh(google_auth_httplib2.Request(http))
+            _save_token(credentials, token_path)
+
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+
+
+def build_service(name: str, version: str, credentials=None, api_endpoint: str = None, http=None):
+    """
+    Build an API client from the discovery document bundled with googleapiclient.
+    Pass either credentials or an already authorized http session.
+    api_endpoint replaces the root URL (e.g. https://www.googleapis.com/), batch requests included,
+    the same way read_sheet_async uses GOOGLE_*_API_ENDPOINT.
+    """
+    from googleapiclient.discovery import build
+
+    batch_uri = None
+    if api_endpoint:
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = json.loads(get_static_doc(name, version))
+        batch_uri = urljoin(api_endpoint, document.get("batchPath", "batch"))
+        api_endpoint = urljoin(api_endpoint, document["servicePath"])
+
+    service = build(
+        name, version,
+        credentials=credentials,
+        http=http,
+        static_discovery=True,
+        cache_discovery=False,
+        client_options={"api_endpoint": api_endpoint},
+    )
 
-    results = drive_service.files().list(
+    if batch_uri:
+        from googleapiclient.http import BatchHttpRequest
+
+        # googleapiclient always sends batches to the public batch URL
+        service.new_batch_http_request = lambda callback=None: BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+    return service
+
+
+class LazyService:
+    """Stands in for an API client and builds it on first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._service = None
+
+    def __getattr__(self, name):
+        if self._service is None:
+            self._service = self._factory()
+        return getattr(self._service, name)
+
+
+class TokenBucket:
+    """Paces calls to `rate` per second on average, allowing bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, cost: float = 1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # A batch costing more than the burst goes out once the bucket is full and leaves a debt
+                if self.tokens >= min(cost, self.burst):
+                    self.tokens -= cost
+                    return
+                wait = (min(cost, self.burst) - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _error_status(exception) -> int | None:
+    return getattr(getattr(exception, "resp", None), "status", None)
+
+
+def _is_throttled(exception) -> bool:
+    """True for 429 and for 403 rateLimitExceeded / userRateLimitExceeded."""
+    status = _error_status(exception)
+    if status == 429:
+        return True
+    if status == 403:
+        content = getattr(exception, "content", b"")
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", "replace")
+        return "ratelimitexceeded" in content.lower()
+    return False
+
+
+def _is_retryable(exception) -> bool:
+    if _is_throttled(exception) or _error_status(exception) in (500, 502, 503, 504):
+        return True
+    # Dropped connections and timeouts, but not HTTP errors with other status codes
+    return isinstance(exception, OSError) and _error_status(exception) is None
+
+
+class RequestScheduler:
+    """
+    Executes every Drive and Sheets request.
+    Each API is paced by a token bucket, throttling and server errors are retried with
+    exponential backoff and jitter, and concurrency is halved whenever the API throttles
+    and grows back one slot at a time while requests succeed.
+    """
+
+    # Requests per second and burst size, kept below the default per-user quotas
+    # (Drive 12 000 queries/minute, Sheets 60 reads/minute)
+    RATES = {
+        "drive": (150, 300),
+        "sheets": (1, 60),
+    }
+
+    def __init__(self, max_workers: int = 8, max_retries: int = 6, max_backoff: float = 64):
+        self.buckets = {api: TokenBucket(rate, burst) for api, (rate, burst) in self.RATES.items()}
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.limit = max_workers
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+        # Builds one authorized http per worker thread; httplib2 sessions are not thread-safe
+        self.http_factory = None
+        self.local = threading.local()
+        self.pool = None
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.max_backoff, 2 ** attempt))
+
+    def throttled(self):
+        """Halve the number of requests allowed in flight."""
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+
+    def _succeeded(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_workers:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def _http(self):
+        if getattr(self.local, "worker", False) and self.http_factory is not None:
+            if getattr(self.local, "http", None) is None:
+                self.local.http = self.http_factory()
+            return self.local.http
+        return None
+
+    def run(self, api: str, call, cost: float = 1):
+        """
+        Run call(http) under pacing and retries. `call` must be safe to repeat;
+        http is None outside worker threads, meaning the client's own session.
+        """
+        for attempt in range(self.max_retries + 1):
+            with self.condition:
+                while self.active >= self.limit:
+                    self.condition.wait()
+                self.active += 1
+            try:
+                self.buckets[api].take(cost)
+                result = call(self._http())
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    raise
+                if _is_throttled(e):
+                    self.throttled()
+            else:
+                self._succeeded()
+                return result
+            finally:
+                with self.condition:
+                    self.active -= 1
+                    self.condition.notify()
+            time.sleep(self.backoff(attempt))
+
+    def execute(self, request, api: str, cost: float = 1):
+        """Execute one googleapiclient request through the scheduler."""
+        return self.run(api, lambda http: request.execute(http=http), cost)
+
+    def map(self, fn, items) -> list:
+        """
+        Apply fn to every item on worker threads and return the results in order.
+        The pool lives as long as the scheduler so worker sessions stay warm; fn must not call map.
+        Without http_factory the items run one by one on the calling thread, since the workers
+        would otherwise share the client's single httplib2 session.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.http_factory is None:
+            return [fn(item) for item in items]
+
+        def work(item):
+            self.local.worker = True
+            return fn(item)
+
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return list(self.pool.map(work, items))
+
+
+SCHEDULER = RequestScheduler()
+
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+# Drive accepts at most 100 calls in one batch request
+BATCH_SIZE = 100
+
+# Sheet ranges per values().batchGet call, to stay well below URL length limits
+BATCH_GET_RANGES = 50
+
+# Rows fetched per request when streaming large sheets
+ROW_WINDOW = 1000
+
+
+def _files_list(drive_service, query: str, fields: str, page_token: str = None):
+    """Build a files().list request for one page of results in the shared drive."""
+    shared_drive_id = os.getenv("GOOGLE_SHARED_DRIVE_ID")
+
+    return drive_service.files().list(
         q=query,
         corpora="drive",
         driveId=shared_drive_id,
         includeItemsFromAllDrives=True,
         supportsAllDrives=True,
-        fields="files(id, name, mimeType, parents)",
-    ).execute()
+        pageSize=1000,
+        pageToken=page_token,
+        fields=f"nextPageToken, files({fields})",
+    )
+
 
-    return results.get("files", [])
+def _list_all(drive_service, query: str, fields: str):
+    """Run a files().list query, following nextPageToken until all pages are read."""
+    files = []
+    page_token = None
+    while True:
+        results = SCHEDULER.execute(_files_list(drive_service, query, fields, page_token), "drive")
+        files.extend(results.get("files", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return files
+
+
+class DriveIndex:
+    """
+    In-memory index of the whole shared drive, built from a single paged listing.
+    Answers name and folder lookups without further API calls.
+    """
+
+    FIELDS = "id, name, mimeType, parents"
+
+    def __init__(self, files: list[dict] = ()):
+        self.files: dict[str, dict] = {}
+        self.children: dict[str, list[dict]] = {}
+        self.by_name: dict[str, list[str]] = {}
+        for f in files:
+            self.add(f)
+
+    @classmethod
+    def from_drive(cls, drive_service):
+        """Snapshot every file in the shared drive."""
+        return cls(_list_all(drive_service, "trashed = false", cls.FIELDS))
+
+    def add(self, f: dict):
+        self.files[f["id"]] = f
+        self.by_name.setdefault(f["name"], []).append(f["id"])
+        for parent_id in f.get("parents", []):
+            self.children.setdefault(parent_id, []).append(f)
+
+    def find(self, name: str, parent_id: str = None) -> list[dict]:
+        matches = [self.files[file_id] for file_id in self.by_name.get(name, [])]
+        if parent_id:
+            matches = [f for f in matches if parent_id in f.get("parents", [])]
+        return matches
+
+    def contents(self, folder_id: str) -> list[dict]:
+        return list(self.children.get(folder_id, []))
+
+
+class DriveTreeCache:
+    """
+    Local SQLite copy of the shared drive tree together with a saved startPageToken.
+    The first sync lists the whole drive; later syncs only apply changes().list deltas.
+    """
+
+    def __init__(self, path: Path = DRIVE_CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                parents TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+    def _get_state(self, key: str):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def _upsert(self, f: dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (id, name, mime_type, parents) VALUES (?, ?, ?, ?)",
+            (f["id"], f["name"], f["mimeType"], json.dumps(f.get("parents", []))),
+        )
+
+    def sync(self, drive_service) -> DriveIndex:
+        """Bring the cache up to date and return it as a DriveIndex."""
+        shared_drive_id = os.getenv("GOOGLE_SHARED_DRIVE_ID")
+        page_token = self._get_state("start_page_token")
+
+        with self.db:
+            if page_token is None or self._get_state("drive_id") != shared_drive_id:
+                self._full_sync(drive_service, shared_drive_id)
+            else:
+                self._apply_changes(drive_service, shared_drive_id, page_token)
+
+        return self.index()
+
+    def _full_sync(self, drive_service, shared_drive_id: str):
+        # Take the token before listing so changes made during the listing are replayed next time
+        page_token = SCHEDULER.execute(
+            drive_service.changes().getStartPageToken(driveId=shared_drive_id, supportsAllDrives=True),
+            "drive",
+        )["startPageToken"]
+
+        self.db.execute("DELETE FROM files")
+        for f in _list_all(drive_service, "trashed = false", DriveIndex.FIELDS):
+            self._upsert(f)
+
+        self._set_state("drive_id", shared_drive_id)
+        self._set_state("start_page_token", page_token)
+
+    def _apply_changes(self, drive_service, shared_drive_id: str, page_token: str):
+        while True:
+            results = SCHEDULER.execute(drive_service.changes().list(
+                pageToken=page_token,
+                driveId=shared_drive_id,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                includeRemoved=True,
+                pageSize=1000,
+                fields=(
+                    "nextPageToken, newStartPageToken, "
+                    f"changes(changeType, fileId, removed, file({DriveIndex.FIELDS}, trashed))"
+                ),
+            ), "drive")
+
+            for change in results.get("changes", []):
+                if change.get("changeType", "file") != "file":
+                    continue
+                f = change.get("file")
+                if change.get("removed") or not f or f.get("trashed"):
+                    self.db.execute("DELETE FROM files WHERE id = ?", (change["fileId"],))
+                else:
+                    self._upsert(f)
+
+            if "newStartPageToken" in results:
+                self._set_state("start_page_token", results["newStartPageToken"])
+                return
+            page_token = results["nextPageToken"]
+
+    def index(self) -> DriveIndex:
+        rows = self.db.execute("SELECT id, name, mime_type, parents FROM files")
+        return DriveIndex(
+            {"id": file_id, "name": name, "mimeType": mime_type, "parents": json.loads(parents)}
+            for file_id, name, mime_type, parents in rows
+        )
+
+
+def find_file_in_drive(drive_service, name: str, parent_id: str = None, index: DriveIndex = None):
+    """Find a file or folder by name in the shared drive."""
+    if index is not None:
+        return index.find(name, parent_id)
 
+    query = f"name = '{name}'"
+    if parent_id:
+        query += f" and '{parent_id}' in parents"
 
-def list_folder_contents(drive_service, folder_id: str):
-    """List contents of a folder."""
-    shared_drive_id = os.getenv("GOOGLE_SHARED_DRIVE_ID")
+    return _list_all(drive_service, query, "id, name, mimeType, parents")
 
-    results = drive_service.files().list(
-        q=f"'{folder_id}' in parents",
-        corpora="drive",
-        driveId=shared_drive_id,
-        includeItemsFromAllDrives=True,
-        supportsAllDrives=True,
-        fields="files(id, name, mimeType)",
-    ).execute()
 
-    return results.get("files", [])
+def list_folder_contents(drive_service, folder_id: str, index: DriveIndex = None):
+    """List contents of a folder."""
+    if index is not None:
+        return index.contents(folder_id)
+
+    return _list_all(drive_service, f"'{folder_id}' in parents", "id, name, mimeType")
+
+
+def list_many_folder_contents(drive_service, folder_ids: list[str]) -> dict[str, list]:
+    """
+    List contents of several folders at once.
+    Queries are sent together as Drive batch requests; folders with more than
+    one page of entries get their next page in the following batch round.
+    """
+    contents = {folder_id: [] for folder_id in folder_ids}
+    # (folder id, page token, failed attempts)
+    pending = [(folder_id, None, 0) for folder_id in folder_ids]
+
+    while pending:
+        next_pending = []
+        errors = []
+
+        # Sub-requests that were throttled in the previous round wait before going out again
+        attempts = max(attempt for _, _, attempt in pending)
+        if attempts:
+            time.sleep(SCHEDULER.backoff(attempts))
+
+        def run_batch(chunk):
+            def callback(request_id, response, exception):
+                folder_id, page_token, attempt = chunk[int(request_id)]
+                if exception is not None:
+                    if _is_retryable(exception) and attempt < SCHEDULER.max_retries:
+                        if _is_throttled(exception):
+                            SCHEDULER.throttled()
+                        next_pending.append((folder_id, page_token, attempt + 1))
+                    else:
+                        errors.append(exception)
+                    return
+                contents[folder_id].extend(response.get("files", []))
+                if response.get("nextPageToken"):
+                    next_pending.append((folder_id, response["nextPageToken"], 0))
+
+            def call(http):
+                batch = drive_service.new_batch_http_request(callback=callback)
+                for i, (folder_id, page_token, _) in enumerate(chunk):
+                    batch.add(
+                        _files_list(drive_service, f"'{folder_id}' in parents", "id, name, mimeType", page_token),
+                        request_id=str(i),
+                    )
+                batch.execute(http=http)
+
+            # Every call in a batch counts against the quota
+            SCHEDULER.run("drive", call, cost=len(chunk))
+
+        SCHEDULER.map(run_batch, [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)])
+
+        if errors:
+            raise errors[0]
+        pending = next_pending
+
+    return contents
+
+
+def fetch_folder_tree(drive_service, folder_id: str, max_depth: int = 3) -> dict[str, list]:
+    """Fetch folder contents level by level down to max_depth, keyed by folder id."""
+    tree = {}
+    level = [folder_id]
+
+    for _ in range(max_depth):
+        if not level:
+            break
+        contents = list_many_folder_contents(drive_service, level)
+        tree.update(contents)
+        level = [
+            f["id"]
+            for parent_id in level
+            for f in contents[parent_id]
+            if f["mimeType"] == FOLDER_MIME_TYPE
+        ]
+
+    return tree
+
+
+def _a1_sheet(title: str) -> str:
+    """Quote a sheet title for use in an A1 range."""
+    return "'" + title.replace("'", "''") + "'"
+
+
+def get_spreadsheet_metadata(sheets_service, spreadsheet_id: str):
+    """Fetch only the spreadsheet title and each sheet's title and grid size."""
+    return SCHEDULER.execute(sheets_service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields="properties.title,sheets.properties(title,gridProperties(rowCount,columnCount))",
+    ), "sheets")
+
+
+def read_spreadsheet(sheets_service, spreadsheet_id: str) -> dict:
+    """
+    Read all data from a spreadsheet.
+    Returns {"title": ..., "sheets": [{"title": ..., "values": [[...], ...]}, ...]}.
+    """
+    metadata = get_spreadsheet_metadata(sheets_service, spreadsheet_id)
+    titles = [sheet["properties"]["title"] for sheet in metadata.get("sheets", [])]
+
+    # All tabs in as few values().batchGet calls as the URL length allows
+    def batch_get(chunk):
+        return SCHEDULER.execute(sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=[_a1_sheet(title) for title in chunk],
+        ), "sheets")
 
+    chunks = [titles[i:i + BATCH_GET_RANGES] for i in range(0, len(titles), BATCH_GET_RANGES)]
+    sheets = []
+    for chunk, result in zip(chunks, SCHEDULER.map(batch_get, chunks)):
+        for title, value_range in zip(chunk, result.get("valueRanges", [])):
+            sheets.append({"title": title, "values": value_range.get("values", [])})
 
-def read_spreadsheet(sheets_service, spreadsheet_id: str):
-    """Read all data from a spreadsheet."""
-    # Get spreadsheet metadata
-    spreadsheet = sheets_service.spreadsheets().get(
-        spreadsheetId=spreadsheet_id
-    ).execute()
+    return {"title": metadata["properties"]["title"], "sheets": sheets}
 
-    print(f"\nSpreadsheet: {spreadsheet['properties']['title']}")
+
+def print_spreadsheet(spreadsheet: dict):
+    """Print a spreadsheet returned by read_spreadsheet as plain tables."""
+    print(f"\nSpreadsheet: {spreadsheet['title']}")
     print("=" * 60)
 
-    # Read each sheet
     for sheet in spreadsheet["sheets"]:
-        sheet_name = sheet["properties"]["title"]
-        print(f"\n## Sheet: {sheet_name}")
+        print(f"\n## Sheet: {sheet['title']}")
         print("-" * 40)
 
-        # Get all values
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=sheet_name
-        ).execute()
-
-        values = result.get("values", [])
-
-        if not values:
+        if not sheet["values"]:
             print("(tom)")
             continue
 
         # Print as table
-        for row in values:
+        for row in sheet["values"]:
             print(" | ".join(str(cell) for cell in row))
 
 
-def list_folder_tree(drive_service, folder_id: str, indent: int = 0, max_depth: int = 3):
+def read_spreadsheet_cached(
+    drive_service,
+    sheets_service,
+    spreadsheet_id: str,
+    refresh: bool = False,
+    cache_dir: Path = SHEET_CACHE_DIR,
+    max_bytes: int = SHEET_CACHE_MAX_BYTES,
+) -> dict:
+    """
+    Read a spreadsheet through a local snapshot keyed on file id and Drive version.
+    An unchanged spreadsheet is served from disk without calling the Sheets API.
+    """
+    file = SCHEDULER.execute(drive_service.files().get(
+        fileId=spreadsheet_id,
+        supportsAllDrives=True,
+        fields="version, modifiedTime",
+    ), "drive")
+    path = cache_dir / f"{spreadsheet_id}-{file['version']}.json.gz"
+
+    if path.exists() and not refresh:
+        # Touch so eviction sees it as recently used
+        os.utime(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    spreadsheet = read_spreadsheet(sheets_service, spreadsheet_id)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for stale in cache_dir.glob(f"{spreadsheet_id}-*.json.gz"):
+        stale.unlink()
+    tmp_path = path.with_suffix(".tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(spreadsheet, f, ensure_ascii=False)
+    tmp_path.replace(path)
+
+    _evict_sheet_cache(cache_dir, max_bytes)
+    return spreadsheet
+
+
+def _evict_sheet_cache(cache_dir: Path, max_bytes: int):
+    """Delete the least recently used snapshots until the cache fits in max_bytes."""
+    entries = sorted(
+        ((p.stat(), p) for p in cache_dir.glob("*.json.gz")),
+        key=lambda entry: entry[0].st_mtime,
+    )
+    total = sum(stat.st_size for stat, _ in entries)
+    for stat, p in entries:
+        if total <= max_bytes:
+            break
+        p.unlink()
+        total -= stat.st_size
+
+
+def iter_sheet_rows(sheets_service, spreadsheet_id: str, title: str, row_count: int, window: int = ROW_WINDOW):
+    """
+    Yield the rows of one sheet, fetched in windows of `window` rows.
+    Row count comes from gridProperties.rowCount, so only one window is held in memory at a time.
+    Empty rows between data are yielded as [], trailing empty rows are dropped like values().get does.
+    """
+    blank_rows = 0
+
+    for start in range(1, row_count + 1, window):
+        end = min(start + window - 1, row_count)
+        result = SCHEDULER.execute(sheets_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{_a1_sheet(title)}!{start}:{end}",
+        ), "sheets")
+        rows = result.get("values", [])
+
+        # The API trims empty rows at the end of each window; they only count if data follows
+        if rows:
+            for _ in range(blank_rows):
+                yield []
+            yield from rows
+            blank_rows = 0
+        blank_rows += (end - start + 1) - len(rows)
+
+
+def stream_spreadsheet(sheets_service, spreadsheet_id: str, window: int = ROW_WINDOW):
+    """Print a spreadsheet like print_spreadsheet, row window by row window."""
+    metadata = get_spreadsheet_metadata(sheets_service, spreadsheet_id)
+
+    print(f"\nSpreadsheet: {metadata['properties']['title']}")
+    print("=" * 60)
+
+    for sheet in metadata.get("sheets", []):
+        properties = sheet["properties"]
+        print(f"\n## Sheet: {properties['title']}")
+        print("-" * 40)
+
+        empty = True
+        row_count = properties.get("gridProperties", {}).get("rowCount", 0)
+        for row in iter_sheet_rows(sheets_service, spreadsheet_id, properties["title"], row_count, window):
+            empty = False
+            print(" | ".join(str(cell) for cell in row))
+
+        if empty:
+            print("(tom)")
+
+
+def list_folder_tree(
+    drive_service, folder_id: str, indent: int = 0, max_depth: int = 3, tree: dict = None, index: DriveIndex = None
+):
     """Recursively list folder structure."""
     if indent >= max_depth:
         return
 
-    contents = list_folder_contents(drive_service, folder_id)
+    if tree is None:
+        if index is not None:
+            tree = index.children
+        else:
+            tree = fetch_folder_tree(drive_service, folder_id, max_depth - indent)
+
+    contents = tree.get(folder_id, [])
 
     # Sort: folders first, then files
-    folders = sorted([f for f in contents if f["mimeType"] == "application/vnd.google-apps.folder"], key=lambda x: x["name"])
-    files = sorted([f for f in contents if f["mimeType"] != "application/vnd.google-apps.folder"], key=lambda x: x["name"])
+    folders = sorted([f for f in contents if f["mimeType"] == FOLDER_MIME_TYPE], key=lambda x: x["name"])
+    files = sorted([f for f in contents if f["mimeType"] != FOLDER_MIME_TYPE], key=lambda x: x["name"])
 
     for folder in folders:
         print(f"{'  ' * indent}📁 {folder['name']}")
-        list_folder_tree(drive_service, folder["id"], indent + 1, max_depth)
+        list_folder_tree(drive_service, folder["id"], indent + 1, max_depth, tree)
 
     # Only show file count if there are files
     if files and indent < max_depth:
@@ -132,39 +782,74 @@ def list_folder_tree(drive_service, folder_id: str, indent: int = 0, max_depth:
 
 
 def main():
-    credentials = get_credentials()
-    drive_service = build("drive", "v3", credentials=credentials)
-    sheets_service = build("sheets", "v4", credentials=credentials)
+    parser = argparse.ArgumentParser(description="Les mappestruktur og regneark fra delt Google Drive")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Hent hele den delte disken i én runde og slå opp i minnet i stedet for per mappe"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"Som --snapshot, men lagret i {DRIVE_CACHE_PATH.name} og oppdatert med kun endringer siden forrige kjøring"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=f"Les regnearket i vinduer på {ROW_WINDOW} rader i stedet for alt på én gang"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Les regnearket fra Sheets API selv om det finnes en lagret kopi av samme versjon"
+    )
+    args = parser.parse_args()
+
+    # Clients are only built when a call actually needs them, e.g. not for cached spreadsheets.
+    # GOOGLE_*_API_ENDPOINT points them at a local fake server when testing, without signing in.
+    # Both clients share one authorized keep-alive session; scheduler worker threads get their own.
+    if os.getenv("GOOGLE_DRIVE_API_ENDPOINT") or os.getenv("GOOGLE_SHEETS_API_ENDPOINT"):
+        import httplib2
+
+        new_http = lambda: httplib2.Http(timeout=60)
+    else:
+        credentials = functools.cache(get_credentials)
+        new_http = lambda: authorized_http(credentials())
+    http = functools.cache(new_http)
+    SCHEDULER.http_factory = new_http
+    drive_service = LazyService(
+        lambda: build_service("drive", "v3", api_endpoint=os.getenv("GOOGLE_DRIVE_API_ENDPOINT"), http=http())
+    )
+    sheets_service = LazyService(
+        lambda: build_service("sheets", "v4", api_endpoint=os.getenv("GOOGLE_SHEETS_API_ENDPOINT"), http=http())
+    )
 
     shared_drive_id = os.getenv("GOOGLE_SHARED_DRIVE_ID")
     print(f"Shared Drive ID: {shared_drive_id}")
 
+    index = None
+    if args.cache:
+        index = DriveTreeCache().sync(drive_service)
+    elif args.snapshot:
+        index = DriveIndex.from_drive(drive_service)
+
     # List full folder structure
     print("\n" + "=" * 60)
     print("MAPPESTRUKTUR I GOOGLE DRIVE")
     print("=" * 60 + "\n")
 
-    list_folder_tree(drive_service, shared_drive_id, max_depth=3)
+    list_folder_tree(drive_service, shared_drive_id, max_depth=3, index=index)
 
     print("\n" + "=" * 60)
-    return
 
     # Find "020 Styret" folder
-    folders_020 = find_file_in_drive(drive_service, "020 Styret")
+    folders_020 = find_file_in_drive(drive_service, "020 Styret", index=index)
 
     if not folders_020:
         print("Fant ikke mappen '020 Styret'")
         # List root contents
         print("\nInnhold i rot:")
-        root_files = drive_service.files().list(
-            q=f"'{shared_drive_id}' in parents",
-            corpora="drive",
-            driveId=shared_drive_id,
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True,
-            fields="files(id, name, mimeType)",
-        ).execute()
-        for f in root_files.get("files", []):
+        for f in list_folder_contents(drive_service, shared_drive_id, index=index):
             print(f"  {f['name']} ({f['mimeType']})")
         return
 
@@ -173,7 +858,7 @@ def main():
 
     # List contents of 020 Styret
     print("\nInnhold i '020 Styret':")
-    contents = list_folder_contents(drive_service, folder_020["id"])
+    contents = list_folder_contents(drive_service, folder_020["id"], index=index)
     for f in contents:
         print(f"  {f['name']} ({f['mimeType']})")
 
@@ -181,7 +866,8 @@ def main():
     sheet_files = find_file_in_drive(
         drive_service,
         "2025-2026 Styrets ansvarsfordeling",
-        folder_020["id"]
+        folder_020["id"],
+        index=index,
     )
 
     if not sheet_files:
@@ -200,7 +886,10 @@ def main():
     print(f"\nFant spreadsheet: {sheet_file['name']} ({sheet_file['id']})")
 
     # Read the spreadsheet
-    read_spreadsheet(sheets_service, sheet_file["id"])
+    if args.stream:
+        stream_spreadsheet(sheets_service, sheet_file["id"])
+    else:
+        print_spreadsheet(read_spreadsheet_cached(drive_service, sheets_service, sheet_file["id"], refresh=args.refresh))
 
 
 if __name__ == "__main__":
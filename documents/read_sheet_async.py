@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "aiohttp",
+#     "google-api-python-client",
+#     "google-auth",
+#     "google-auth-httplib2",
+#     "httplib2",
+#     "python-dotenv",
+# ]
+# ///
+"""
+Asyncio variant of read_sheet.py for use inside async services.
+Talks to the Drive and Sheets REST APIs directly over one aiohttp session,
+so hundreds of requests can be in flight on a single event loop.
+"""
+
+import asyncio
+import datetime
+import os
+import random
+
+import aiohttp
+
+import read_sheet
+from read_sheet import BATCH_GET_RANGES, FOLDER_MIME_TYPE, _a1_sheet
+
+
+class AsyncGoogleClient:
+    """
+    Authorized aiohttp session for the Drive and Sheets APIs.
+    GOOGLE_DRIVE_API_ENDPOINT / GOOGLE_SHEETS_API_ENDPOINT point it at a local stand-in server,
+    in which case credentials can be left out.
+    """
+
+    def __init__(self, credentials=None, max_in_flight: int = 100, max_retries: int = 6):
+        drive_endpoint = os.getenv("GOOGLE_DRIVE_API_ENDPOINT") or "https://www.googleapis.com/"
+        sheets_endpoint = os.getenv("GOOGLE_SHEETS_API_ENDPOINT") or "https://sheets.googleapis.com/"
+        self.urls = {
+            "drive": drive_endpoint.rstrip("/") + "/drive/v3/",
+            "sheets": sheets_endpoint.rstrip("/") + "/v4/",
+        }
+        self.credentials = credentials
+        self.max_retries = max_retries
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.token_lock = asyncio.Lock()
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def _headers(self) -> dict:
+        if self.credentials is None:
+            return {}
+
+        async with self.token_lock:
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            expiry = self.credentials.expiry
+            if not self.credentials.token or expiry is None or expiry - now < read_sheet.TOKEN_REFRESH_MARGIN:
+                # Token cache and refresh are blocking; keep them off the event loop
+                await asyncio.to_thread(read_sheet.authorized_http, self.credentials)
+
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def get(self, api: str, path: str, params) -> dict:
+        """GET a JSON resource, retrying throttling and server errors with backoff and jitter."""
+        url = self.urls[api] + path
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.in_flight:
+                    async with self.session.get(url, params=params, headers=await self._headers()) as response:
+                        if response.status < 400:
+                            return await response.json()
+
+                        body = await response.text()
+                        throttled = response.status == 429 or (
+                            response.status == 403 and "ratelimitexceeded" in body.lower()
+                        )
+                        if not throttled and response.status not in (500, 502, 503, 504):
+                            response.raise_for_status()
+                        if attempt == self.max_retries:
+                            response.raise_for_status()
+            except aiohttp.ClientConnectionError:
+                if attempt == self.max_retries:
+                    raise
+
+            await asyncio.sleep(random.uniform(0, min(64, 2 ** attempt)))
+
+
+def _list_params(query: str, fields: str, page_token: str = None) -> dict:
+    params = {
+        "q": query,
+        "corpora": "drive",
+        "driveId": os.getenv("GOOGLE_SHARED_DRIVE_ID"),
+        "includeItemsFromAllDrives": "true",
+        "supportsAllDrives": "true",
+        "pageSize": "1000",
+        "fields": f"nextPageToken, files({fields})",
+    }
+    if page_token:
+        params["pageToken"] = page_token
+    return params
+
+
+async def _list_all(client: AsyncGoogleClient, query: str, fields: str) -> list[dict]:
+    """Run a files.list query, following nextPageToken until all pages are read."""
+    files = []
+    page_token = None
+    while True:
+        results = await client.get("drive", "files", _list_params(query, fields, page_token))
+        files.extend(results.get("files", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return files
+
+
+async def find_file_in_drive(client: AsyncGoogleClient, name: str, parent_id: str = None) -> list[dict]:
+    """Find a file or folder by name in the shared drive."""
+    query = f"name = '{name}'"
+    if parent_id:
+        query += f" and '{parent_id}' in parents"
+
+    return await _list_all(client, query, "id, name, mimeType, parents")
+
+
+async def list_folder_contents(client: AsyncGoogleClient, folder_id: str) -> list[dict]:
+    """List contents of a folder."""
+    return await _list_all(client, f"'{folder_id}' in parents", "id, name, mimeType")
+
+
+async def fetch_folder_tree(client: AsyncGoogleClient, folder_id: str, max_depth: int = 3) -> dict[str, list]:
+    """
+    Fetch folder contents level by level down to max_depth, keyed by folder id.
+    All folders of a level are listed concurrently; print with read_sheet.list_folder_tree(tree=...).
+    """
+    tree = {}
+    level = [folder_id]
+
+    for _ in range(max_depth):
+        if not level:
+            break
+        contents = await asyncio.gather(*(list_folder_contents(client, parent_id) for parent_id in level))
+        tree.update(zip(level, contents))
+        level = [
+            f["id"]
+            for folder_contents in contents
+            for f in folder_contents
+            if f["mimeType"] == FOLDER_MIME_TYPE
+        ]
+
+    return tree
+
+
+async def read_spreadsheet(client: AsyncGoogleClient, spreadsheet_id: str) -> dict:
+    """Read all data from a spreadsheet, in the same shape as read_sheet.read_spreadsheet."""
+    metadata = await client.get("sheets", f"spreadsheets/{spreadsheet_id}", {
+        "fields": "properties.title,sheets.properties(title,gridProperties(rowCount,columnCount))",
+    })
+    titles = [sheet["properties"]["title"] for sheet in metadata.get("sheets", [])]
+
+    chunks = [titles[i:i + BATCH_GET_RANGES] for i in range(0, len(titles), BATCH_GET_RANGES)]
+    results = await asyncio.gather(*(
+        client.get("sheets", f"spreadsheets/{spreadsheet_id}/values:batchGet", [
+            ("ranges", _a1_sheet(title)) for title in chunk
+        ])
+        for chunk in chunks
+    ))
+
+    sheets = []
+    for chunk, result in zip(chunks, results):
+        for title, value_range in zip(chunk, result.get("valueRanges", [])):
+            sheets.append({"title": title, "values": value_range.get("values", [])})
+
+    return {"title": metadata["properties"]["title"], "sheets": sheets}
+
+
+async def main():
+    shared_drive_id = os.getenv("GOOGLE_SHARED_DRIVE_ID")
+    credentials = None if os.getenv("GOOGLE_DRIVE_API_ENDPOINT") else read_sheet.get_credentials()
+
+    async with AsyncGoogleClient(credentials) as client:
+        tree = await fetch_folder_tree(client, shared_drive_id, max_depth=3)
+
+    print("\n" + "=" * 60)
+    print("MAPPESTRUKTUR I GOOGLE DRIVE")
+    print("=" * 60 + "\n")
+
+    read_sheet.list_folder_tree(None, shared_drive_id, max_depth=3, tree=tree)
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Ytelsestester for migrate_archive.py med pytest-benchmark, på det syntetiske arkivet fra
+benchmark_migrate_archive.py. Hvert trinn måles kaldt, med tømte cacher før hver runde.
+Hoppes over hvis pytest-benchmark ikke er installert.
+
+Kjør med:
+    uv run --with pytest --with pytest-benchmark pytest documents/test_benchmark_migrate_archive.py --benchmark-autosave
+    uv run --with pytest --with pytest-benchmark pytest documents/test_benchmark_migrate_archive.py \\
+        --benchmark-compare --benchmark-compare-fail=median:20%
+"""
+import contextlib
+import io
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import benchmark_migrate_archive
+import migrate_archive
+from benchmark_migrate_archive import _tøm_cacher
+
+ANTALL_FILER = 5000
+RUNDER = 5
+
+
+@pytest.fixture(scope="module")
+def mapper(tmp_path_factory):
+    """Peker migrate_archive mot et syntetisk arkiv og gir mappene som skal migreres."""
+    rot = tmp_path_factory.mktemp("arkiv")
+    kilde = benchmark_migrate_archive.generer_arkiv(rot, ANTALL_FILER)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(migrate_archive, "DRIVE", rot)
+        mp.setattr(migrate_archive, "MÅL", rot)
+        mp.setattr(migrate_archive, "KILDE", kilde)
+        mp.setattr(migrate_archive, "HASHCACHE", None)  # Mål hashingen, ikke cachen
+        yield migrate_archive.STANDARD_MAPPER
+
+
+def _alle_filer(mapper):
+    return [fil for mappe in mapper for fil in migrate_archive.samle_filer(migrate_archive.KILDE / mappe)]
+
+
+def _kaldt(*args):
+    """Oppsett for benchmark.pedantic: tøm cachene og gi argumentene til målingen."""
+    _tøm_cacher()
+    return args, {}
+
+
+def test_skann(benchmark, mapper):
+    filer = benchmark.pedantic(_alle_filer, setup=lambda: _kaldt(mapper), rounds=RUNDER)
+    assert len(filer) > ANTALL_FILER * 0.9
+
+
+def test_klassifiser(benchmark, mapper):
+    filer = _alle_filer(mapper)
+
+    def klassifiser(filer):
+        return [migrate_archive.bestem_målmappe(fil, fil.relative_to(migrate_archive.KILDE)) for fil in filer]
+
+    benchmark.pedantic(klassifiser, setup=lambda: _kaldt(filer), rounds=RUNDER)
+
+
+def test_planlegg(benchmark, mapper):
+    flyttinger = benchmark.pedantic(migrate_archive.planlegg_flyttinger, setup=lambda: _kaldt(mapper), rounds=RUNDER)
+    assert flyttinger
+
+
+def _ny_plan(mapper, avgjort=False):
+    """Oppsett med en ny plan per runde, siden avgjør_duplikater og utfør_flyttinger endrer flyttingene."""
+    _tøm_cacher()
+    flyttinger = migrate_archive.planlegg_flyttinger(mapper)
+    if avgjort:
+        flyttinger = migrate_archive.avgjør_duplikater(flyttinger)
+    _tøm_cacher()
+    return (flyttinger,), {}
+
+
+def test_duplikater(benchmark, mapper):
+    resultat = benchmark.pedantic(migrate_archive.avgjør_duplikater, setup=lambda: _ny_plan(mapper), rounds=RUNDER)
+    assert any(f.duplikat_av is not None for f in resultat)
+
+
+def test_dry_run(benchmark, mapper):
+    def dry_run(flyttinger):
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate_archive.utfør_flyttinger(flyttinger, dry_run=True, avgjort=True)
+
+    benchmark.pedantic(dry_run, setup=lambda: _ny_plan(mapper, avgjort=True), rounds=RUNDER)
@@ -0,0 +1,283 @@
+"""
+Tester for migrate_archive.py.
+
+Kjør med:
+    uv run --with pytest pytest documents/test_migrate_archive.py
+"""
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+import migrate_archive
+from benchmark_migrate_archive import generer_arkiv
+
+# Navn → [normaliser_filnavn, ekstraher_dato], tatt fra utgaven før tolkningen ble skrevet om
+FILNAVN = json.loads((Path(__file__).parent / "testdata" / "migrate_archive_filnavn.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("navn", sorted(FILNAVN))
+def test_filnavn_som_før(navn):
+    normalisert, dato = FILNAVN[navn]
+    assert migrate_archive.normaliser_filnavn(navn) == normalisert
+    assert migrate_archive.ekstraher_dato(navn) == dato
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    """En falsk delt disk på en lokal server, med MÅL som roten og uten ventetid mellom nye forsøk."""
+    pytest.importorskip("googleapiclient")
+    pytest.importorskip("dotenv")
+    import read_sheet
+    from fake_google import FakeGoogle, serve
+
+    fake = FakeGoogle()
+    with serve(fake) as endepunkt:
+        monkeypatch.setenv("GOOGLE_DRIVE_API_ENDPOINT", endepunkt)
+        monkeypatch.setenv("GOOGLE_SHARED_DRIVE_ID", fake.drive_id)
+        monkeypatch.setattr(read_sheet, "SCHEDULER", read_sheet.RequestScheduler(max_backoff=0))
+        monkeypatch.setattr(migrate_archive, "MÅL", Path("/Drive"))
+        monkeypatch.setattr(migrate_archive, "KILDE", Path("/Drive/900 Arkiv"))
+        yield fake
+
+
+def _mappe(fake, *navn) -> str:
+    """Id-en til mappen med den stien, og sjekk at det bare finnes én av hver underveis."""
+    forelder = fake.drive_id
+    for n in navn:
+        treff = [f["id"] for f in fake.files.values() if f["name"] == n and forelder in f["parents"]]
+        assert len(treff) == 1, f"{n}: {len(treff)} mapper"
+        forelder = treff[0]
+    return forelder
+
+
+def test_drive_backend_oppretter_mapper_og_flytter(drive):
+    arkiv = drive.add_folder("900 Arkiv")
+    styret = drive.add_folder("Styret", arkiv)
+    drive.add_file("Referat.pdf", styret)
+    drive.add_file("Budsjett.xlsx", styret)
+    MÅL = migrate_archive.MÅL
+
+    backend = migrate_archive.DriveBackend()
+    # Svaret på første opprettelse går tapt, så mappen finnes allerede når kallet forsøkes igjen
+    drive.fail("files.create", status=503, reason="backendError", after=True)
+    backend.forbered([MÅL / "020 Styret" / "2024" / "Referater", MÅL / "030 Økonomi"])
+
+    assert drive.children(drive.drive_id) == ["020 Styret", "030 Økonomi", "900 Arkiv"]
+    _mappe(drive, "020 Styret", "2024", "Referater")
+    assert drive.calls["files.generateIds"] == 1
+    assert drive.calls["files.create"] == 4 + 1
+
+    backend.flytt(MÅL / "900 Arkiv" / "Styret" / "Referat.pdf", MÅL / "020 Styret" / "2024" / "Referater" / "2024 Referat.pdf")
+    assert drive.children(_mappe(drive, "020 Styret", "2024", "Referater")) == ["2024 Referat.pdf"]
+    assert drive.children(styret) == ["Budsjett.xlsx"]
+
+    # Det samme når én mappe opprettes underveis i flyttingen
+    drive.fail("files.create", status=503, reason="backendError", after=True)
+    backend.opprett_mappe(MÅL / "030 Økonomi" / "Budsjett")
+    backend.flytt(MÅL / "900 Arkiv" / "Styret" / "Budsjett.xlsx", MÅL / "030 Økonomi" / "Budsjett" / "Budsjett.xlsx")
+    assert drive.children(_mappe(drive, "030 Økonomi", "Budsjett")) == ["Budsjett.xlsx"]
+
+
+@pytest.fixture
+def arkiv(tmp_path, monkeypatch):
+    """Et syntetisk "900 Arkiv" under tmp_path/"Drive", med MÅL som roten og cache og journal ved siden av."""
+    rot = tmp_path / "Drive"
+    generer_arkiv(rot, 300, frø=3)
+    bruk(monkeypatch, rot)
+    monkeypatch.setattr(migrate_archive, "HASHCACHE_FIL", tmp_path / "hasher.sqlite")
+    monkeypatch.setattr(migrate_archive, "JOURNAL_FIL", tmp_path / "journal.jsonl")
+    monkeypatch.setattr(migrate_archive, "HASHCACHE", None)
+    monkeypatch.setattr(migrate_archive, "PROFIL", migrate_archive.PROFIL)
+    return rot
+
+
+def bruk(monkeypatch, rot: Path) -> None:
+    """Peker DRIVE og MÅL på rot og KILDE på arkivet under den."""
+    monkeypatch.setattr(migrate_archive, "DRIVE", rot)
+    monkeypatch.setattr(migrate_archive, "KILDE", rot / "900 Arkiv")
+    monkeypatch.setattr(migrate_archive, "MÅL", rot)
+
+
+def ren_kjøring(arkiv: Path, monkeypatch, capsys, *args) -> dict[str, bytes]:
+    """Treet etter en kjøring uten avbrudd på en kopi av arkivet."""
+    kopi = arkiv.with_name("Kopi")
+    shutil.copytree(arkiv, kopi)
+    bruk(monkeypatch, kopi)
+    assert kjør(monkeypatch, capsys, *args)[0] == 0
+    bruk(monkeypatch, arkiv)
+    return tre(kopi)
+
+
+def kjør(monkeypatch, capsys, *args) -> tuple[int, str]:
+    """Kjører main() med argumentene; gir returkoden og utskriften."""
+    monkeypatch.setattr(sys, "argv", ["migrate_archive.py", *args])
+    kode = migrate_archive.main()
+    return kode, capsys.readouterr().out
+
+
+def tre(rot: Path) -> dict[str, bytes]:
+    return {str(p.relative_to(rot)): p.read_bytes() for p in rot.rglob("*") if p.is_file()}
+
+
+def test_pipeline_som_stanset_under_lesingen_gjenopptas_ikke(arkiv, monkeypatch, capsys):
+    før = tre(arkiv)
+    planlegg_fortløpende = migrate_archive.planlegg_fortløpende
+
+    def stanser(mapper):
+        for nr, f in enumerate(planlegg_fortløpende(mapper)):
+            if nr == 40:
+                raise OSError("Drive-mounten forsvant")
+            yield f
+
+    monkeypatch.setattr(migrate_archive, "planlegg_fortløpende", stanser)
+    with pytest.raises(OSError):
+        kjør(monkeypatch, capsys, "--pipeline")
+    etter_krasj = tre(arkiv)
+    assert etter_krasj != før
+
+    # Journalen har bare filene som ble lest før krasjet, så --resume nekter i stedet for å melde suksess
+    kode, ut = kjør(monkeypatch, capsys, "--resume")
+    assert kode == 1
+    assert "Kjør --pipeline på nytt" in ut
+    assert tre(arkiv) == etter_krasj
+
+    monkeypatch.setattr(migrate_archive, "planlegg_fortløpende", planlegg_fortløpende)
+    assert kjør(monkeypatch, capsys, "--pipeline")[0] == 0
+    assert tre(arkiv) != etter_krasj
+    assert kjør(monkeypatch, capsys, "--resume")[0] == 0
+
+    # Tilbakeføringen tar med flyttingene fra både den avbrutte kjøringen og den nye
+    assert kjør(monkeypatch, capsys, "--rollback")[0] == 0
+    assert tre(arkiv) == før
+
+
+def test_små_filer_hashes_ikke_to_ganger(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrate_archive, "HASHCACHE", None)
+    hashet = []
+    fil_hash = migrate_archive.fil_hash
+    monkeypatch.setattr(migrate_archive, "fil_hash", lambda sti: hashet.append(sti.name) or fil_hash(sti))
+
+    innhold = {
+        # Den delvise hashen dekker hele filen, også midten
+        "liten": (b"a" * migrate_archive.DELVIS_HELE, b"a" * migrate_archive.DELVIS_HELE),
+        "liten ulik": (b"a" * 1000, b"b" * 1000),
+        # Lik start og slutt, ulik midte
+        "stor": (b"a" * (migrate_archive.DELVIS_HELE + 1), b"a" * 65536 + b"b" + b"a" * 65536),
+    }
+    flyttinger = []
+    for navn, (a, b) in innhold.items():
+        for i, data in enumerate((a, b)):
+            kilde = tmp_path / str(i) / f"{navn}.pdf"
+            kilde.parent.mkdir(exist_ok=True)
+            kilde.write_bytes(data)
+            flyttinger.append(migrate_archive.Flytting(kilde=kilde, mål=tmp_path / "mål" / f"{navn}.pdf", kategori=""))
+
+    resultat = migrate_archive.finn_duplikater(flyttinger)
+    assert [(f.kilde.name, f.er_identisk) for f in resultat if f.duplikat_av] == [
+        ("liten.pdf", True), ("liten ulik.pdf", False), ("stor.pdf", False),
+    ]
+    assert sorted(hashet) == ["stor.pdf", "stor.pdf"]
+
+    hashet.clear()
+    assert migrate_archive.likt_innhold(*(tmp_path / str(i) / "liten.pdf" for i in range(2)))
+    assert not migrate_archive.likt_innhold(*(tmp_path / str(i) / "stor.pdf" for i in range(2)))
+    assert hashet == ["stor.pdf", "stor.pdf"]
+
+
+@pytest.mark.parametrize("mistet", [0, 20])
+def test_avbrutt_kjøring_gjenopptas_og_tilbakeføres(arkiv, monkeypatch, capsys, mistet):
+    før = tre(arkiv)
+    fasit = ren_kjøring(arkiv, monkeypatch, capsys)
+
+    flytt = migrate_archive.LokalBackend.flytt
+    flyttet = []
+
+    def avbrytes(self, kilde, mål):
+        if len(flyttet) >= 50:
+            raise OSError("Drive-mounten forsvant")
+        flyttet.append(kilde)
+        flytt(self, kilde, mål)
+
+    monkeypatch.setattr(migrate_archive.LokalBackend, "flytt", avbrytes)
+    with pytest.raises(OSError):
+        kjør(monkeypatch, capsys)
+    monkeypatch.setattr(migrate_archive.LokalBackend, "flytt", flytt)
+    assert tre(arkiv) not in (før, fasit)
+
+    # De siste flyttingene var ikke synket til disk da kjøringen stanset
+    journal = migrate_archive.JOURNAL_FIL
+    linjer = journal.read_text(encoding="utf-8").splitlines(keepends=True)
+    flyttet_linjer = [nr for nr, linje in enumerate(linjer) if '"hendelse": "flyttet"' in linje]
+    assert len(flyttet_linjer) > mistet
+    for nr in reversed(flyttet_linjer[len(flyttet_linjer) - mistet:]):
+        del linjer[nr]
+    journal.write_text("".join(linjer), encoding="utf-8")
+
+    assert kjør(monkeypatch, capsys, "--resume")[0] == 0
+    assert tre(arkiv) == fasit
+
+    assert kjør(monkeypatch, capsys, "--rollback")[0] == 0
+    assert tre(arkiv) == før
+
+
+def planlagt(plan: Path) -> list[dict]:
+    return [json.loads(linje) for linje in plan.read_text(encoding="utf-8").splitlines()[1:]]
+
+
+def endre(sti: Path, endring: str) -> None:
+    if endring == "størrelse":
+        with open(sti, "ab") as fil:
+            fil.write(b"x")
+    else:
+        stat = sti.stat()
+        os.utime(sti, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.mark.parametrize("endring", ["størrelse", "mtime"])
+def test_plan_brukes_ikke_når_en_kilde_er_endret(arkiv, tmp_path, monkeypatch, capsys, endring):
+    plan = tmp_path / "plan.jsonl"
+    assert kjør(monkeypatch, capsys, "--save-plan", str(plan))[0] == 0
+    endre(migrate_archive.KILDE / planlagt(plan)[0]["kilde"], endring)
+    før = tre(arkiv)
+
+    kode, ut = kjør(monkeypatch, capsys, "--apply-plan", str(plan))
+    assert kode == 1
+    assert f"❌ 1 filer er endret eller borte siden planen ble laget:\n   {planlagt(plan)[0]['kilde']}\n" in ut
+    assert tre(arkiv) == før
+
+
+def test_global_plan_sjekker_duplikater_i_målet(arkiv, tmp_path, monkeypatch, capsys):
+    plan = tmp_path / "plan.jsonl"
+    assert kjør(monkeypatch, capsys, "--save-plan", str(plan))[0] == 0
+    kilde = next(linje["kilde"] for linje in planlagt(plan) if "duplikat_av" not in linje and linje["stat"][0])
+    eksisterende = arkiv / "999 Annet" / "Kopi.pdf"
+    eksisterende.parent.mkdir()
+    shutil.copy2(migrate_archive.KILDE / kilde, eksisterende)
+
+    assert kjør(monkeypatch, capsys, "--save-plan", str(plan), "--global-dedup")[0] == 0
+    linje = next(linje for linje in planlagt(plan) if linje["kilde"] == kilde)
+    assert (linje["duplikat_av"], linje["duplikat_i_mål"], linje["er_identisk"]) == ("999 Annet/Kopi.pdf", True, True)
+
+    # Filen i målet er endret, så avgjørelsen om å hoppe over kilden kan være feil
+    endre(eksisterende, "mtime")
+    før = tre(arkiv)
+    kode, ut = kjør(monkeypatch, capsys, "--apply-plan", str(plan))
+    assert kode == 1
+    assert "   999 Annet/Kopi.pdf\n" in ut
+    assert tre(arkiv) == før
+
+    assert kjør(monkeypatch, capsys, "--save-plan", str(plan), "--global-dedup")[0] == 0
+    assert kjør(monkeypatch, capsys, "--apply-plan", str(plan))[0] == 0
+    assert (migrate_archive.KILDE / kilde).exists()
+    assert not (arkiv / linje["mål"]).exists()
+
+
+def test_mål_deler_sorterer_som_mål():
+    mål = ["/Drive/020 Styret/Referat.pdf", "/Drive/020 Styret/2024/Referat.pdf", "/Drive/020 Styret 2/A.pdf",
+           "/Drive/020 Styret/2024/Referat (Gamle).pdf", "/Drive/020 Styret/Å.pdf", "/Drive/020 Styret/a.pdf"]
+    flyttinger = [migrate_archive.Flytting(kilde=Path("/Drive/900 Arkiv/x"), mål=Path(m), kategori="") for m in mål]
+    assert sorted(flyttinger, key=lambda f: f.mål_deler) == sorted(flyttinger, key=lambda f: f.mål)
@@ -0,0 +1,208 @@
+"""
+Tests for read_sheet.py against the local Drive and Sheets stand-in in fake_google.py.
+
+Run with:
+    uv run --with pytest --with google-api-python-client --with google-auth-httplib2 --with python-dotenv \\
+        pytest documents/test_read_sheet.py
+"""
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("dotenv")
+
+import httplib2
+
+import read_sheet
+from fake_google import FakeGoogle, serve
+
+
+@pytest.fixture
+def google(monkeypatch):
+    """A fake shared drive served locally, with both API endpoints pointing at it and no retry delays."""
+    fake = FakeGoogle(max_page_size=2)
+    with serve(fake) as endpoint:
+        monkeypatch.setenv("GOOGLE_SHARED_DRIVE_ID", fake.drive_id)
+        monkeypatch.setenv("GOOGLE_DRIVE_API_ENDPOINT", endpoint)
+        monkeypatch.setenv("GOOGLE_SHEETS_API_ENDPOINT", endpoint)
+        monkeypatch.setattr(read_sheet, "SCHEDULER", read_sheet.RequestScheduler(max_backoff=0))
+        yield fake
+
+
+@pytest.fixture
+def drive_service(google):
+    return read_sheet.build_service("drive", "v3", api_endpoint=os.getenv("GOOGLE_DRIVE_API_ENDPOINT"), http=httplib2.Http())
+
+
+def names(index: read_sheet.DriveIndex, folder_id: str) -> list[str]:
+    return sorted(f["name"] for f in index.contents(folder_id))
+
+
+def test_drive_tree_cache_full_sync_then_changes(google, drive_service, tmp_path):
+    styret = google.add_folder("020 Styret")
+    google.add_file("Referat.pdf", styret)
+    trashed = google.add_file("Gammelt referat.pdf", styret)
+    removed = google.add_file("Utkast.pdf", styret)
+    google.trash(google.add_file("Allerede slettet.pdf", styret))
+
+    cache = read_sheet.DriveTreeCache(tmp_path / "drive-tree.sqlite")
+    index = cache.sync(drive_service)
+    assert names(index, styret) == ["Gammelt referat.pdf", "Referat.pdf", "Utkast.pdf"]
+    assert names(index, google.drive_id) == ["020 Styret"]
+    assert google.calls["changes.list"] == 0
+    listed = google.calls["files.list"]
+    assert listed > 1  # Paged, two files per page
+
+    added = google.add_file("Nytt referat.pdf", styret)
+    google.trash(trashed)
+    google.remove(removed)
+    google.update_file(added, name="Referat 2025.pdf")
+
+    index = cache.sync(drive_service)
+    assert google.calls["files.list"] == listed  # Only the delta is fetched
+    assert google.calls["changes.list"] > 1
+    assert names(index, styret) == ["Referat 2025.pdf", "Referat.pdf"]
+
+    # The saved token survives a restart, and an unchanged drive gives an empty delta
+    reopened = read_sheet.DriveTreeCache(tmp_path / "drive-tree.sqlite")
+    assert names(reopened.sync(drive_service), styret) == ["Referat 2025.pdf", "Referat.pdf"]
+    assert google.calls["files.list"] == listed
+
+
+def test_drive_tree_cache_resyncs_other_drive(google, drive_service, tmp_path, monkeypatch):
+    google.add_file("Referat.pdf")
+    cache = read_sheet.DriveTreeCache(tmp_path / "drive-tree.sqlite")
+    cache.sync(drive_service)
+    listed = google.calls["files.list"]
+
+    monkeypatch.setenv("GOOGLE_SHARED_DRIVE_ID", "another-drive")
+    cache.sync(drive_service)
+    assert google.calls["files.list"] > listed
+
+
+class FakeCredentials:
+    """Service account credentials that count refreshes instead of calling Google."""
+
+    service_account_email = "arkiv@example.iam.gserviceaccount.com"
+    scopes = read_sheet.SCOPES
+
+    def __init__(self):
+        self.token = None
+        self.expiry = None
+        self.refreshes = 0
+
+    def refresh(self, request):
+        time.sleep(0.05)  # Long enough for the other threads to pile up behind the first
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(hours=1)
+
+
+def test_authorized_http_refreshes_once_for_concurrent_workers(tmp_path):
+    credentials = FakeCredentials()
+    token_path = tmp_path / "token.json"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sessions = list(pool.map(lambda _: read_sheet.authorized_http(credentials, token_path), range(8)))
+
+    assert credentials.refreshes == 1
+    assert len({id(session.http) for session in sessions}) == 8
+    assert json.loads(token_path.read_text())["token"] == "token-1"
+
+    # A later run reuses the saved token
+    restarted = FakeCredentials()
+    read_sheet.authorized_http(restarted, token_path)
+    assert (restarted.refreshes, restarted.token) == (0, "token-1")
+
+
+@pytest.mark.parametrize("cached", ["", "[]", '{"account": "x"}', json.dumps({
+    "account": FakeCredentials.service_account_email,
+    "scopes": read_sheet.SCOPES,
+    "token": "old",
+})])
+def test_unusable_token_cache_is_ignored(tmp_path, cached):
+    token_path = tmp_path / "token.json"
+    token_path.write_text(cached)
+    credentials = FakeCredentials()
+    read_sheet.authorized_http(credentials, token_path)
+    assert credentials.refreshes == 1
+
+
+def test_scheduler_map_without_http_factory_stays_on_calling_thread():
+    scheduler = read_sheet.RequestScheduler()
+    assert set(scheduler.map(lambda _: threading.get_ident(), range(20))) == {threading.get_ident()}
+
+
+def test_scheduler_map_gives_each_worker_its_own_http():
+    scheduler = read_sheet.RequestScheduler(max_workers=4)
+    scheduler.http_factory = object
+
+    def work(_):
+        time.sleep(0.01)
+        return threading.get_ident(), id(scheduler.run("drive", lambda http: http))
+
+    used = scheduler.map(work, range(40))
+    per_thread = {thread: {http for t, http in used if t == thread} for thread, _ in used}
+    assert all(len(https) == 1 for https in per_thread.values())
+    assert len({http for _, http in used}) == len(per_thread) > 1
+
+
+@pytest.fixture
+def styret(google, tmp_path, monkeypatch):
+    """The board folder with the spreadsheet main() looks for; snapshots are cached under tmp_path."""
+    monkeypatch.setattr(
+        read_sheet,
+        "read_spreadsheet_cached",
+        functools.partial(read_sheet.read_spreadsheet_cached, cache_dir=tmp_path / "sheets"),
+    )
+    folder = google.add_folder("020 Styret")
+    google.add_file("Referat.pdf", folder)
+    return google.add_spreadsheet(
+        "2025-2026 Styrets ansvarsfordeling",
+        {"Ansvar": [["Oppgave", "Ansvarlig"], ["Brygga", "Kari"], [], ["Vei", "Ola"]], "Kontakt": []},
+        folder,
+    )
+
+
+def run_main(monkeypatch, capsys, *args) -> str:
+    monkeypatch.setattr(sys, "argv", ["read_sheet.py", *args])
+    read_sheet.main()
+    return capsys.readouterr().out
+
+
+def test_main_reads_spreadsheet_after_folder_tree(google, styret, monkeypatch, capsys):
+    out = run_main(monkeypatch, capsys)
+    assert "📁 020 Styret" in out
+    assert "Fant spreadsheet: 2025-2026 Styrets ansvarsfordeling" in out
+    assert "Oppgave | Ansvarlig\nBrygga | Kari\n\nVei | Ola\n" in out
+    assert "## Sheet: Kontakt\n" + "-" * 40 + "\n(tom)" in out
+    assert google.calls["values.batchGet"] == 1
+
+    # Same Drive version: served from the local snapshot
+    assert "Brygga | Kari" in run_main(monkeypatch, capsys)
+    assert google.calls["values.batchGet"] == 1
+
+    assert "Brygga | Kari" in run_main(monkeypatch, capsys, "--refresh")
+    assert google.calls["values.batchGet"] == 2
+
+
+def test_main_streams_spreadsheet_in_row_windows(google, monkeypatch, capsys):
+    folder = google.add_folder("020 Styret")
+    # Data on both sides of the first window boundary, then empty rows to the end of the grid
+    rows = [["Oppgave", "Ansvarlig"], ["Brygga", "Kari"]] + [[]] * 997 + [["Vei", "Ola"], [], ["Strand", "Per"]]
+    google.add_spreadsheet("2025-2026 Styrets ansvarsfordeling", {"Ansvar": rows, "Kontakt": []}, folder, row_count=2500)
+
+    out = run_main(monkeypatch, capsys, "--stream")
+    table = out.split("## Sheet: Ansvar\n" + "-" * 40 + "\n")[1].split("\n## Sheet:")[0]
+    assert table.splitlines() == ["Oppgave | Ansvarlig", "Brygga | Kari"] + [""] * 997 + ["Vei | Ola", "", "Strand | Per"]
+    assert "## Sheet: Kontakt\n" + "-" * 40 + "\n(tom)" in out
+    assert google.calls["values.get"] == 2 * 3  # 2500 rows in windows of 1000, for both tabs
+    assert google.calls["values.batchGet"] == 0
@@ -0,0 +1,139 @@
+"""
+Tests for read_sheet_async.py against the stand-in in fake_google.py, served with aiohttp.
+
+Run with:
+    uv run --with pytest --with aiohttp --with google-api-python-client --with google-auth-httplib2 \\
+        --with python-dotenv pytest documents/test_read_sheet_async.py
+"""
+import asyncio
+import contextlib
+import json
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+
+import aiohttp
+from aiohttp import web
+
+import read_sheet_async
+from fake_google import FakeGoogle
+
+
+@contextlib.asynccontextmanager
+async def serve(fake: FakeGoogle):
+    """Serve fake with aiohttp on a free local port; yields the endpoint URL."""
+
+    async def handle(request: web.Request) -> web.Response:
+        payload = await request.read()
+        status, result = fake.handle(request.method, request.raw_path, json.loads(payload) if payload else None)
+        return web.json_response(result, status=status)
+
+    app = web.Application()
+    app.router.add_route("*", "/{path:.*}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f"http://127.0.0.1:{port}/"
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def google(monkeypatch):
+    """A fake shared drive, two entries per listing page, with retries that do not sleep."""
+    monkeypatch.setenv("GOOGLE_SHARED_DRIVE_ID", "shared-drive")
+    monkeypatch.setattr(read_sheet_async.random, "uniform", lambda a, b: 0)
+    return FakeGoogle(drive_id="shared-drive", max_page_size=2)
+
+
+def run(fake: FakeGoogle, monkeypatch, work):
+    """Run work(client) on a fresh event loop with both endpoints pointing at fake."""
+
+    async def main():
+        async with serve(fake) as endpoint:
+            monkeypatch.setenv("GOOGLE_DRIVE_API_ENDPOINT", endpoint)
+            monkeypatch.setenv("GOOGLE_SHEETS_API_ENDPOINT", endpoint)
+            async with read_sheet_async.AsyncGoogleClient() as client:
+                return await work(client)
+
+    return asyncio.run(main())
+
+
+def test_listing_follows_every_page(google, monkeypatch):
+    styret = google.add_folder("020 Styret")
+    referater = google.add_folder("Referater", styret)
+    for i in range(5):
+        google.add_file(f"Referat {i}.pdf", referater)
+    google.add_file("Ansvarsfordeling", styret)
+
+    tree = run(google, monkeypatch, lambda client: read_sheet_async.fetch_folder_tree(client, google.drive_id))
+
+    assert [f["name"] for f in tree[google.drive_id]] == ["020 Styret"]
+    assert sorted(f["name"] for f in tree[styret]) == ["Ansvarsfordeling", "Referater"]
+    assert sorted(f["name"] for f in tree[referater]) == [f"Referat {i}.pdf" for i in range(5)]
+    assert google.calls["files.list"] == 1 + 1 + 3
+
+
+def test_throttling_is_retried(google, monkeypatch):
+    for i in range(3):
+        google.add_file(f"Referat {i}.pdf")
+    google.fail("files.list", status=429, times=2)
+    google.fail("files.list", status=403, reason="rateLimitExceeded")
+    google.fail("files.list", status=403, reason="userRateLimitExceeded")
+    google.fail("files.list", status=503, reason="backendError")
+
+    files = run(google, monkeypatch, lambda client: read_sheet_async.list_folder_contents(client, google.drive_id))
+
+    assert sorted(f["name"] for f in files) == [f"Referat {i}.pdf" for i in range(3)]
+    assert google.calls["files.list"] == 5 + 2
+
+
+def test_other_errors_are_not_retried(google, monkeypatch):
+    google.fail("files.list", status=403, reason="insufficientFilePermissions")
+
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        run(google, monkeypatch, lambda client: read_sheet_async.list_folder_contents(client, google.drive_id))
+
+    assert error.value.status == 403
+    assert google.calls["files.list"] == 1
+
+
+def test_retries_give_up_after_max_retries(google, monkeypatch):
+    google.fail("files.list", status=429, times=10)
+
+    async def work(client):
+        client.max_retries = 2
+        return await read_sheet_async.list_folder_contents(client, google.drive_id)
+
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        run(google, monkeypatch, work)
+
+    assert error.value.status == 429
+    assert google.calls["files.list"] == 3
+
+
+def test_read_spreadsheet_batches_tabs(google, monkeypatch):
+    monkeypatch.setattr(read_sheet_async, "BATCH_GET_RANGES", 2)
+    tabs = {
+        "Ansvar": [["Oppgave", "Ansvarlig"], ["Brygga", "Kari"]],
+        "Kari's liste": [["Vei"]],
+        "Tom": [],
+        "Kontakt": [["Navn", "Telefon"], [], ["Ola", "12345678"]],
+        "Arkiv": [["2024"]],
+    }
+    spreadsheet_id = google.add_spreadsheet("2025-2026 Styrets ansvarsfordeling", tabs)
+    google.fail("values.batchGet", status=429)
+
+    spreadsheet = run(google, monkeypatch, lambda client: read_sheet_async.read_spreadsheet(client, spreadsheet_id))
+
+    assert spreadsheet == {
+        "title": "2025-2026 Styrets ansvarsfordeling",
+        "sheets": [{"title": title, "values": values} for title, values in tabs.items()],
+    }
+    assert google.calls["spreadsheets.get"] == 1
+    assert google.calls["values.batchGet"] == 3 + 1